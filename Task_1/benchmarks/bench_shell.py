@@ -0,0 +1,162 @@
+"""Нагрузочные замеры эмулятора на синтетических архивах.
+
+Пример:
+    python benchmarks/bench_shell.py --members 100000 --width 20 --depth 3 --output bench.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import BashFake  # noqa: E402
+from src.output import BufferedOutput  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def generate_archive(path, members, width, depth, file_size):
+    """Архив из каталогов width^1..width^depth и файлов, разложенных по листовым каталогам."""
+    dirs = [""]
+    level = [""]
+    for _ in range(depth):
+        level = [f"{parent}d{i}/" for parent in level for i in range(width)]
+        dirs.extend(level)
+        if len(dirs) >= members // 2:
+            break
+    leaves = level
+    line = b"lorem ipsum dolor sit amet\n"
+    data = (line * (file_size // len(line) + 1))[:file_size]
+    files = []
+    with tarfile.open(path, "w") as tar:
+        for name in dirs[1:]:
+            info = tarfile.TarInfo(f"./file_system/{name}".rstrip("/"))
+            info.type = tarfile.DIRTYPE
+            tar.addfile(info)
+        for i in range(max(members - len(dirs) + 1, 0)):
+            name = f"{leaves[i % len(leaves)]}f{i}.txt"
+            info = tarfile.TarInfo(f"./file_system/{name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            files.append(name)
+    return [name.rstrip("/") for name in dirs[1:]], files
+
+
+def command_mixes(dirs, files, count, rng):
+    return {
+        "navigate": [cmd for _ in range(count // 3)
+                     for cmd in (f"cd /{rng.choice(dirs)}", "ls", "cd ..")],
+        "read": [f"{rng.choice(('cat', 'wc', 'head'))} /{rng.choice(files)}" for _ in range(count)],
+        "write": [f"touch /{rng.choice(dirs)}/new_{i}.txt" for i in range(count)],
+        "aggregate": [f"du -s /{rng.choice(dirs)}" for _ in range(count)],
+        "search": [f"find /{rng.choice(dirs)} -name f1*" for _ in range(max(count // 100, 1))],
+    }
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    points = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "count": len(samples),
+        "p50_us": points[49] / 1000,
+        "p90_us": points[89] / 1000,
+        "p99_us": points[98] / 1000,
+        "max_us": samples[-1] / 1000,
+    }
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def open_shell(config):
+    started = time.perf_counter()
+    shell = BashFake(config, BufferedOutput(open(os.devnull, "w")))
+    return shell, time.perf_counter() - started
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_shell_")
+    archive = os.path.join(workdir, "file_system.tar")
+    config = os.path.join(workdir, "config.csv")
+
+    started = time.perf_counter()
+    dirs, files = generate_archive(archive, args.members, args.width, args.depth, args.file_size)
+    generate_time = time.perf_counter() - started
+    with open(config, "w") as file:
+        file.write(f"file_system,{archive}\nstart_script,\n")
+
+    shell, cold_start = open_shell(config)
+    shell, warm_start = open_shell(config)
+
+    results = {}
+    for mix, commands in command_mixes(dirs, files, args.commands, rng).items():
+        latencies = []
+        mix_started = time.perf_counter()
+        for command in commands:
+            started = time.perf_counter_ns()
+            shell.cmd_processing(command)
+            latencies.append(time.perf_counter_ns() - started)
+        elapsed = time.perf_counter() - mix_started
+        shell.console.flush()
+        results[mix] = dict(percentiles(latencies), commands_per_sec=len(commands) / elapsed)
+
+    started = time.perf_counter()
+    shell._sync()
+    sync_time = time.perf_counter() - started
+
+    report = {
+        "params": vars(args),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "archive": {"members": len(dirs) + len(files), "bytes": os.path.getsize(archive),
+                    "generate_s": generate_time},
+        "startup": {"cold_s": cold_start, "warm_s": warm_start},
+        "commands": results,
+        "sync_s": sync_time,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    if not args.keep:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры ls/cd/touch/cat и скриптов на синтетическом архиве")
+    parser.add_argument("--members", type=int, default=10000, help="число элементов архива (1k - 1M)")
+    parser.add_argument("--width", type=int, default=10, help="подкаталогов в каждом каталоге")
+    parser.add_argument("--depth", type=int, default=3, help="глубина дерева каталогов")
+    parser.add_argument("--file-size", type=int, default=256, help="размер каждого файла в байтах")
+    parser.add_argument("--commands", type=int, default=3000, help="команд в каждом наборе")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированный архив")
+    parser.add_argument("--output", help="куда записать JSON, по умолчанию stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
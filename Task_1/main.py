@@ -1,87 +1,272 @@
-from src.console import Console
+from src.index import archive_stem, open_archive, save_index
+from src.journal import Journal
+from src.output import BufferedOutput
+from src.search import compile_pattern, grep
+from src.tree import resolve, split_path, walk
+import argparse
 import csv
+import fnmatch
+import os
+import re
+import sys
 import threading
 import tarfile
 
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.csv")
+
 
 class BashFake:
-    path = "/"
     config = {
         "file_system": "",
         "start_script": "",
+        "sync_bytes": "1048576",
+        "sync_interval": "5",
+        "scrollback": "5000",
     }
 
-    def __init__(self):
-        self.console = Console(self.cmd_processing)
-        with open(r'C:\Users\slava\PycharmProjects\Configuration_management\Task_1\config.csv', newline='') as csvfile:
+    def __init__(self, config_path=CONFIG_PATH, console=None):
+        self.console = console or BufferedOutput(sys.stdout)
+        self.lock = threading.Lock()
+        self.config = dict(self.config)
+        with open(config_path, newline='') as csvfile:
             spamreader = csv.reader(csvfile, delimiter=',')
             for row in spamreader:
                 self.config[row[0]] = row[1]
-        self.path = self.config["file_system"].replace(".tar", "") + "/"
+        self.tree, self.reader, self.compressed = open_archive(self.config["file_system"])
+        self.home, self.home_parts = self.tree.home(archive_stem(self.config["file_system"]))
+        self.cwd = ()
+        self.journal = Journal(self.config["file_system"], int(self.config["sync_bytes"]),
+                               float(self.config["sync_interval"]), self._save_index)
+
+    @property
+    def path(self):
+        return "./" + "".join(part + "/" for part in self.home_parts + self.cwd)
+
+    @path.setter
+    def path(self, value):
+        parts = tuple(split_path(value))
+        if parts[:len(self.home_parts)] == self.home_parts:
+            parts = parts[len(self.home_parts):]
+        self.cwd = resolve((), "/".join(parts))
 
+    def _node(self, path):
+        return self.tree.descend(self.home, resolve(self.cwd, path))
 
     def _ls(self, append_path=""):
-        path = self.get_path(append_path)
-        elems = set()
-        with tarfile.open(self.config["file_system"], "r") as tar:
-            for member in tar.getmembers():
-                if not member.name.startswith(path):
-                    continue
-                elems.add(member.name.split("/")[path.count("/")])
-        return "\n".join(elems)
+        node = self._node(append_path)
+        if node is None or not node.is_dir:
+            return ""
+        return "\n".join(node.children)
 
     def _cd(self, path):
-        self.path = self.path.replace("//", "/")
-        if type(path) != list:
-            path = path.split("/")
-        if path[0] == "" and len(path) > 1:
-            self.path = "/".join(self.path.split("/")[:2]) + "/"
-            return self._cd(path[1:])
-        if path[0] == "" or path[0] == "-":
-            self.path = self.config["file_system"].replace(".tar", "") + "/"
+        if path in ("", "-"):
+            self.cwd = ()
             return
-        if path[0] == "..":
-            if self.path == "./file_system/":
-                return self._cd(path[1:])
-            self.path = "/".join(self.path.split("/")[:-2]) + "/"
-            return self._cd(path[1:])
-        elif path[0] == ".":
-            return self._cd(path[1:])
-        else:
-            with tarfile.open(self.config["file_system"], "r") as tar:
-                for member in tar.getmembers():
-                    if member.name == self.path + "/".join(path) and member.isdir():
-                        break
-                else:
-                    return "No such directory"
-
-            self.path += "/".join(path) + "/"
-            self.path = self.path.replace("//", "/")
+        parts = resolve(self.cwd, path)
+        node = self.tree.descend(self.home, parts)
+        if node is None or not node.is_dir:
+            return "No such directory"
+        self.cwd = parts
 
     def _touch(self, path):
-        with tarfile.open(self.config["file_system"], "a") as tar:
-            try:
-                tar.addfile(tarfile.TarInfo(self.get_path(path)))
-            except:
-                return "Can't create file"
-
-    def get_path(self, path):
-        path = path.split("/")
-        result_path = self.path
-        if path[0] == "" and len(path) > 1:
-            result_path = "./file_system/"
-            path = path[1:]
-        for elem in path:
-            if elem == "..":
-                result_path = "/".join(result_path.split("/")[:-2]) + "/"
-            elif elem == ".":
+        if not path:
+            return "No file name"
+        if self.compressed:
+            return "Read-only file system"
+        parts = resolve(self.cwd, path)
+        if not parts or self.tree.descend(self.home, parts) is not None:
+            return
+        parent = self.tree.descend(self.home, parts[:-1])
+        if parent is None or not parent.is_dir:
+            return "No such directory"
+        name = "./" + "/".join(self.home_parts + parts)
+        self.tree.add(name)
+        try:
+            self.journal.add(tarfile.TarInfo(name))
+        except (OSError, tarfile.TarError):
+            return "Can't create file"
+
+    def _sync(self):
+        try:
+            self.journal.flush()
+        except (OSError, tarfile.TarError):
+            return "Can't sync archive"
+
+    def _save_index(self):
+        save_index(self.config["file_system"], self.tree)
+
+    def _file_node(self, path):
+        node = self._node(path)
+        if node is None:
+            return None, "No such file"
+        if node.is_dir:
+            return None, "Is a directory"
+        return node, None
+
+    def _cat(self, paths):
+        result = []
+        for path in paths:
+            node, error = self._file_node(path)
+            if error:
+                return error
+            result.append(str(self.reader.read(node), "utf-8", "replace"))
+        return "".join(result).rstrip("\n")
+
+    def _head(self, path, lines=10):
+        node, error = self._file_node(path)
+        if error:
+            return error
+        if lines <= 0:
+            return ""
+        chunks = []
+        # Переводы строк ищутся прямо в буфере архива, копируется только то, что попадёт в вывод
+        for buffer, start, stop in self.reader.iter_spans(node.offset, node.size):
+            position = start
+            while lines:
+                newline = buffer.find(b"\n", position, stop)
+                if newline == -1:
+                    break
+                position = newline + 1
+                lines -= 1
+            if not lines:
+                chunks.append(buffer[start:position - 1])
+                break
+            chunks.append(buffer[start:stop])
+        return b"".join(chunks).decode("utf-8", "replace").rstrip("\n")
+
+    def _wc(self, path):
+        node, error = self._file_node(path)
+        if error:
+            return error
+        lines = words = 0
+        in_word = False
+        for view in self.reader.iter_chunks(node):
+            # split нужен bytes, поэтому блок копируется один раз здесь
+            chunk = view.tobytes()
+            lines += chunk.count(b"\n")
+            words += len(chunk.split())
+            # Слово, разрезанное границей блоков, не считаем дважды
+            if in_word and not chunk[:1].isspace():
+                words -= 1
+            in_word = not chunk[-1:].isspace()
+        return f"{lines} {words} {node.size} {path}"
+
+    def _find(self, args):
+        path, pattern, kind = ".", None, None
+        args = iter(args)
+        for arg in args:
+            if arg == "-name":
+                pattern = next(args, None)
+            elif arg == "-type":
+                kind = next(args, None)
+            else:
+                path = arg
+        node = self._node(path)
+        if node is None:
+            return "No such file or directory"
+        result = []
+        for name, child in walk(node, path.rstrip("/") or "/"):
+            if pattern is not None and not fnmatch.fnmatchcase(child.name, pattern):
+                continue
+            if kind == "f" and child.is_dir or kind == "d" and not child.is_dir:
                 continue
+            result.append(name)
+        return "\n".join(result)
+
+    def _du(self, args):
+        summary = "-s" in args
+        paths = [arg for arg in args if arg != "-s"] or ["."]
+        result = []
+        for path in paths:
+            node = self._node(path)
+            if node is None:
+                result.append(f"{path}: No such file or directory")
+            elif summary or not node.is_dir:
+                result.append(f"{node.total}\t{path}")
+            else:
+                dirs = [(name, child) for name, child in walk(node, path.rstrip("/") or "/") if child.is_dir]
+                result.extend(f"{child.total}\t{name}" for name, child in reversed(dirs))
+        return "\n".join(result)
+
+    def _grep(self, args):
+        recursive = list_files = False
+        limit = jobs = None
+        rest = []
+        args = iter(args)
+        for arg in args:
+            if arg == "-r":
+                recursive = True
+            elif arg == "-l":
+                list_files = True
+            elif arg in ("-m", "-j"):
+                value = next(args, "")
+                if not value.isdigit() or int(value) == 0:
+                    yield f"Invalid {arg} value"
+                    return
+                if arg == "-m":
+                    limit = int(value)
+                else:
+                    jobs = int(value)
+            else:
+                rest.append(arg)
+        if len(rest) < 2:
+            yield "Usage: grep [-r] [-l] [-m N] [-j N] PATTERN PATH..."
+            return
+        try:
+            pattern = compile_pattern(rest[0])
+        except re.error:
+            yield "Invalid pattern"
+            return
+
+        members = []
+        for path in rest[1:]:
+            node = self._node(path)
+            if node is None:
+                yield f"{path}: No such file or directory"
+            elif node.is_dir and not recursive:
+                yield f"{path}: Is a directory"
             else:
-                result_path += elem + "/"
-            result_path = result_path.replace("//", "/")
-        return result_path
+                members.extend((name, child.offset, child.size)
+                               for name, child in walk(node, path.rstrip("/") or "/")
+                               if not child.is_dir and child.size)
+        show_names = recursive or len(rest) > 2
+        for name, lines in grep(self.reader, pattern, members, jobs, 1 if list_files else limit):
+            if list_files:
+                if lines:
+                    yield name
+            elif show_names:
+                yield from (f"{name}:{line}" for line in lines)
+            else:
+                yield from lines
+
+    def _tree(self, path="."):
+        node = self._node(path)
+        if node is None or not node.is_dir:
+            return "No such directory"
+        result = [path]
+        dirs = 0
+        # Префиксы отрисовки лежат в стеке рядом с узлом, поэтому глубина дерева не ограничена рекурсией
+        stack = self._tree_items(node, "")
+        while stack:
+            child, line, prefix = stack.pop()
+            result.append(line + child.name)
+            if child.is_dir:
+                dirs += 1
+                stack.extend(self._tree_items(child, prefix))
+        result.append(f"\n{dirs} directories, {node.files} files")
+        return "\n".join(result)
+
+    @staticmethod
+    def _tree_items(node, prefix):
+        last = len(node.children) - 1
+        return [(child, prefix + ("└── " if i == last else "├── "), prefix + ("    " if i == last else "│   "))
+                for i, child in reversed(list(enumerate(node.children.values())))]
 
     def cmd_processing(self, command):
+        with self.lock:
+            self._process(command)
+
+    def _process(self, command):
         command = command.split(" ")
         match command[0]:
             case "ls":
@@ -94,9 +279,7 @@ class BashFake:
                 if error:
                     self.console.print(error)
 
-                new_path = self.path.replace(
-                    self.config["file_system"].replace(".tar", ""), "")
-                self.console.set_path(new_path)
+                self.console.set_path("/" + "".join(part + "/" for part in self.cwd))
             case "touch":
                 try:
                     error = self._touch(command[1])
@@ -104,11 +287,57 @@ class BashFake:
                         self.console.print(error)
                 except IndexError as IE:
                     self.console.print("No file name")
+            case "cat":
+                if len(command) > 1:
+                    self.console.print(self._cat(command[1:]))
+                else:
+                    self.console.print("No file name")
+            case "head":
+                if len(command) > 3 and command[1] == "-n" and command[2].isdigit():
+                    self.console.print(self._head(command[3], int(command[2])))
+                elif len(command) > 1:
+                    self.console.print(self._head(command[1]))
+                else:
+                    self.console.print("No file name")
+            case "wc":
+                if len(command) > 1:
+                    self.console.print(self._wc(command[1]))
+                else:
+                    self.console.print("No file name")
+            case "grep":
+                for line in self._grep(command[1:]):
+                    self.console.print(line)
+            case "find":
+                self.console.print(self._find(command[1:]))
+            case "du":
+                self.console.print(self._du(command[1:]))
+            case "tree":
+                self.console.print(self._tree(command[1] if len(command) > 1 else "."))
+            case "sync":
+                error = self._sync()
+                if error:
+                    self.console.print(error)
+            case "clear":
+                self.console.clear()
             case _:
                 self.console.print("Unknown command")
 
+        try:
+            self.journal.flush_if_due()
+        except (OSError, tarfile.TarError):
+            self.console.print("Can't sync archive")
         self.console.insert_prompt()
 
+    def run_script(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line == "exit":
+                break
+            self.cmd_processing(line)
+        self.console.flush()
+
     def run_start_script(self):
         if self.config["start_script"]:
             script = open(self.config["start_script"], "r")
@@ -120,13 +349,38 @@ class BashFake:
             script.close()
 
     def run(self):
-        start_cmds = threading.Thread(target=self.run_start_script)
+        from src.console import Console
+
+        self.console = Console(self.cmd_processing, int(self.config["scrollback"]))
+        start_cmds = threading.Thread(target=self.run_start_script, daemon=True)
         start_cmds.start()
         self.console.run()
+        self._sync()
+
+    def run_headless(self, script=None):
+        if script is None or script == "-":
+            self.run_script(sys.stdin)
+        else:
+            with open(script, "r") as lines:
+                self.run_script(lines)
+        error = self._sync()
+        if error:
+            print(error, file=sys.stderr)
 
 
 def main():
-    not_bash = BashFake()
+    parser = argparse.ArgumentParser(description="Эмулятор оболочки над tar-архивом")
+    parser.add_argument("script", nargs="?", help="файл со списком команд, '-' - стандартный ввод")
+    parser.add_argument("--headless", action="store_true", help="выполнить команды без GUI и выйти")
+    parser.add_argument("--config", default=CONFIG_PATH, help="путь к config.csv")
+    args = parser.parse_args()
+
+    not_bash = BashFake(args.config)
+    if args.headless:
+        not_bash.run_headless(args.script)
+        return
+    if args.script:
+        not_bash.config["start_script"] = args.script
     not_bash.run()
 
 
@@ -1,3 +1,4 @@
+import queue
 import tkinter as tk
 from tkinter import scrolledtext
 
@@ -8,10 +9,14 @@ class Console:
     prompt_color = "#00e676"  # Зеленый для prompt
     prompt_user_color = "#00e676"  # Ярко-зеленый для пользователя
     prompt_path_color = "#29b6f6"  # Голубой для пути
+    refresh_ms = 16  # Примерно один кадр
 
-    def __init__(self, cmd_callback):
+    def __init__(self, cmd_callback, max_lines=5000):
         self.cmd_callback = cmd_callback
         self.path = "/"
+        self.max_lines = max_lines
+        # Вывод из любых потоков копится здесь и переносится в виджет только из потока Tk
+        self.pending = queue.SimpleQueue()
 
         self.root = tk.Tk()
         self.root.title("Not Bash")
@@ -25,12 +30,11 @@ class Console:
 
         self.console.tag_configure("user", foreground=self.prompt_user_color)
         self.console.tag_configure("path", foreground=self.prompt_path_color)
+        self.root.after(self.refresh_ms, self._drain)
 
     def execute_command(self, event):
-        input_text = self.console.get("1.0", tk.END)
-
-        command = input_text.split("\n")[-2].strip()
-        command = command.split("$")[1].strip()
+        command = self.console.get("end-1c linestart", "end-1c").strip()
+        command = command.split("$", 1)[1].strip()
 
         if command == "exit":
             self.root.quit()
@@ -39,20 +43,50 @@ class Console:
         self.console.insert(tk.END, "\n")
         self.cmd_callback(command)
 
-        if command == "clear":
-            self.console.delete('1.0', tk.END)
-            self.insert_prompt()
-
         return "break"
 
     def print(self, text=""):
-        self.console.insert(tk.END, f"{text}\n")
+        self.pending.put((f"{text}\n", ()))
 
     def insert_prompt(self):
-        self.console.insert(tk.END, "user@computer", "user")
-        self.console.insert(tk.END, f":{self.path}", "path")
-        self.console.insert(tk.END, "$ ")
-        self.console.mark_set("insert", tk.END)
+        self.pending.put(("user@computer", "user"))
+        self.pending.put((f":{self.path}", "path"))
+        self.pending.put(("$ ", ()))
+
+    def clear(self):
+        self.pending.put(None)
+
+    def _drain(self):
+        # Всё накопленное за кадр вставляется одним вызовом insert
+        chunks = []
+        cleared = False
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                chunks = []
+                cleared = True
+            else:
+                chunks.extend(item)
+        if cleared:
+            self.console.delete('1.0', tk.END)
+        if chunks:
+            self.console.insert(tk.END, *chunks)
+            self._trim()
+        if cleared or chunks:
+            self.console.mark_set("insert", tk.END)
+            self.console.see(tk.END)
+        self.root.after(self.refresh_ms, self._drain)
+
+    def _trim(self):
+        lines = int(self.console.index("end-1c").split(".")[0])
+        if lines > self.max_lines:
+            self.console.delete('1.0', f"{lines - self.max_lines + 1}.0")
+
+    def flush(self):
+        pass
 
     def set_path(self, path):
         self.path = path
@@ -0,0 +1,231 @@
+import bisect
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import stat
+import tarfile
+import zlib
+
+from src.reader import CHUNK_SIZE, ArchiveReader
+from src.tree import FileTree
+
+INDEX_VERSION = 3
+BLOCK_SIZE = 4 << 20
+
+
+def cache_dir():
+    """Личный каталог кэша (0700); каталог другого владельца или доступный другим не используется."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "bashfake")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o077 or \
+            hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise OSError(f"{path}: каталог кэша доступен другим пользователям")
+    return path
+
+
+def sidecar_paths(archive, suffix):
+    # Рядом с архивом, а если его каталог только для чтения - в личном кэше пользователя
+    yield archive + suffix
+    try:
+        directory = cache_dir()
+    except OSError:
+        return
+    digest = hashlib.sha1(os.path.abspath(archive).encode("utf-8", "surrogateescape")).hexdigest()
+    yield os.path.join(directory, digest + suffix)
+
+
+def open_sidecar(archive, suffix, mode="wb"):
+    """Файл рядом с архивом, открытый на запись, или такой же в запасном каталоге."""
+    error = OSError(f"{archive}: некуда записать {suffix}")
+    for path in sidecar_paths(archive, suffix):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            return open(path, mode)
+        except OSError as e:
+            error = e
+    raise error
+
+
+def compression(archive):
+    with open(archive, "rb") as file:
+        magic = file.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        return "gz"
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return "xz"
+    return None
+
+
+def archive_stem(archive):
+    name = os.path.basename(archive)
+    for suffix in (".tar.gz", ".tar.xz", ".tgz", ".txz", ".tar"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def archive_key(archive):
+    info = os.stat(archive)
+    return INDEX_VERSION, info.st_mtime_ns, info.st_size
+
+
+def load_index(archive):
+    # Индекс хранится в JSON: в нём только строки и числа, и чужой файл не может выполнить код при чтении
+    key = list(archive_key(archive))
+    for path in sidecar_paths(archive, ".idx"):
+        try:
+            with open(path, "rb") as file:
+                index = json.load(file)
+        except (OSError, ValueError, RecursionError):
+            continue
+        if not isinstance(index, dict) or index.get("key") != key:
+            continue
+        if index.get("compression") and not os.path.exists(index.get("blocks") or ""):
+            continue
+        return index
+    return None
+
+
+def save_index(archive, tree, checkpoints=None, compressed=None, blocks=None):
+    index = {
+        "key": archive_key(archive),
+        "compression": compressed,
+        "blocks": blocks,
+        "entries": list(tree.entries()),
+        "checkpoints": checkpoints or [],
+    }
+    try:
+        with open_sidecar(archive, ".idx", "w") as file:
+            json.dump(index, file, separators=(",", ":"))
+    except OSError:
+        pass
+
+
+class _BlockWriter:
+    """Поток распакованного архива, который попутно перекладывается в независимо сжатые блоки."""
+
+    def __init__(self, source, out):
+        self.source = source
+        self.out = out
+        self.buffer = bytearray()
+        self.position = 0
+        self.checkpoints = []
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self._write_block(BLOCK_SIZE)
+        return data
+
+    def _write_block(self, length):
+        packed = zlib.compress(self.buffer[:length], 1)
+        del self.buffer[:length]
+        self.checkpoints.append((self.position, self.out.tell(), len(packed)))
+        self.out.write(packed)
+        self.position += length
+
+    def finish(self):
+        while self.read(BLOCK_SIZE):
+            pass
+        if self.buffer:
+            self._write_block(len(self.buffer))
+
+
+def scan_archive(archive, compressed):
+    """(дерево, контрольные точки, путь к файлу блоков); для несжатого архива блоков нет."""
+    if not compressed:
+        return FileTree.from_tar(archive), [], None
+
+    opener = gzip.open if compressed == "gz" else lzma.open
+    with opener(archive, "rb") as source, open_sidecar(archive, ".blk") as out:
+        stream = _BlockWriter(source, out)
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            tree = FileTree.from_entries(
+                (member.name, member.isdir(), member.size, member.offset_data) for member in tar)
+        stream.finish()
+    return tree, stream.checkpoints, os.path.abspath(out.name)
+
+
+class BlockReader:
+    """Чтение сжатого архива через контрольные точки: распаковываются только блоки, которые занимает файл."""
+
+    def __init__(self, path, checkpoints):
+        self.path = path
+        self.checkpoints = checkpoints
+        self.starts = [start for start, _, _ in checkpoints]
+        self._file = None
+        self._cached = (None, b"")
+
+    def _block(self, number):
+        if self._cached[0] != number:
+            if self._file is None:
+                self._file = open(self.path, "rb")
+            _, offset, length = self.checkpoints[number]
+            self._file.seek(offset)
+            self._cached = (number, zlib.decompress(self._file.read(length)))
+        return self._cached[1]
+
+    def read(self, node):
+        return memoryview(b"".join(self.iter_chunks(node)))
+
+    def iter_chunks(self, node, chunk_size=CHUNK_SIZE):
+        return self.iter_range(node.offset, node.size, chunk_size)
+
+    def iter_range(self, offset, size, chunk_size=CHUNK_SIZE):
+        for buffer, start, stop in self.iter_spans(offset, size, chunk_size):
+            yield memoryview(buffer)[start:stop]
+
+    def iter_spans(self, offset, size, chunk_size=CHUNK_SIZE):
+        """Как у ArchiveReader: буфер здесь - распакованный блок."""
+        if not size:
+            return
+        position = offset
+        end = offset + size
+        number = bisect.bisect_right(self.starts, position) - 1
+        while position < end:
+            block = self._block(number)
+            start = self.starts[number]
+            stop = min(end - start, len(block))
+            for piece in range(position - start, stop, chunk_size):
+                yield block, piece, min(piece + chunk_size, stop)
+            position = start + len(block)
+            number += 1
+
+    def detach(self):
+        # Общая с родителем позиция в файле сломала бы seek, поэтому процесс открывает файл заново
+        self._file = None
+        self._cached = (None, b"")
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_file"] = None
+        state["_cached"] = (None, b"")
+        return state
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_archive(archive):
+    compressed = compression(archive)
+    index = load_index(archive)
+    if index is None:
+        tree, checkpoints, blocks = scan_archive(archive, compressed)
+        save_index(archive, tree, checkpoints, compressed, blocks)
+    else:
+        try:
+            tree, checkpoints, blocks = FileTree.from_entries(index["entries"]), index["checkpoints"], index["blocks"]
+        except (KeyError, TypeError, ValueError):
+            # Ключ совпал, но содержимое испорчено - сканируем заново
+            tree, checkpoints, blocks = scan_archive(archive, compressed)
+            save_index(archive, tree, checkpoints, compressed, blocks)
+    if compressed:
+        return tree, BlockReader(blocks, checkpoints), compressed
+    return tree, ArchiveReader(archive), compressed
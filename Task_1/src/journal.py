@@ -0,0 +1,41 @@
+import tarfile
+import time
+
+
+class Journal:
+    """Отложенная запись в архив: новые элементы копятся в памяти и дописываются одной пачкой."""
+
+    def __init__(self, archive, max_bytes=1 << 20, max_delay=5.0, on_flush=None):
+        self.archive = archive
+        self.on_flush = on_flush
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_write = None
+
+    def add(self, info):
+        if not self.pending:
+            self.first_write = time.monotonic()
+        self.pending.append(info)
+        # Заголовок плюс данные, выровненные по блокам tar
+        self.pending_bytes += tarfile.BLOCKSIZE + -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if not self.pending:
+            return
+        if self.pending_bytes >= self.max_bytes or time.monotonic() - self.first_write >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with tarfile.open(self.archive, "a") as tar:
+            for info in self.pending:
+                tar.addfile(info)
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_write = None
+        if self.on_flush:
+            self.on_flush()
@@ -0,0 +1,31 @@
+class BufferedOutput:
+    """Вывод без GUI: строки копятся в памяти и пишутся в поток крупными порциями."""
+
+    def __init__(self, stream, limit=1 << 16):
+        self.stream = stream
+        self.limit = limit
+        self.path = "/"
+        self.buffer = []
+        self.size = 0
+
+    def print(self, text=""):
+        self.buffer.append(text)
+        self.size += len(text) + 1
+        if self.size >= self.limit:
+            self.flush()
+
+    def insert_prompt(self):
+        pass
+
+    def set_path(self, path):
+        self.path = path
+
+    def clear(self):
+        pass
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+            self.size = 0
+        self.stream.flush()
@@ -0,0 +1,54 @@
+import mmap
+
+CHUNK_SIZE = 1 << 20
+
+
+class ArchiveReader:
+    """Чтение файлов архива по смещениям из индекса: срезы отображённого в память tar без копирования."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._map = None
+
+    def _mapped(self):
+        if self._map is None:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def read(self, node):
+        if not node.size:
+            return memoryview(b"")
+        return memoryview(self._mapped())[node.offset:node.offset + node.size]
+
+    def iter_chunks(self, node, chunk_size=CHUNK_SIZE):
+        return self.iter_range(node.offset, node.size, chunk_size)
+
+    def iter_range(self, offset, size, chunk_size=CHUNK_SIZE):
+        for buffer, start, stop in self.iter_spans(offset, size, chunk_size):
+            yield memoryview(buffer)[start:stop]
+
+    def iter_spans(self, offset, size, chunk_size=CHUNK_SIZE):
+        """Тройки (буфер, начало, конец) без копирования: у mmap есть find/rfind с границами, и по нему ищет re."""
+        if not size:
+            return
+        mapped = self._mapped()
+        end = offset + size
+        for start in range(offset, end, chunk_size):
+            yield mapped, start, min(start + chunk_size, end)
+
+    def detach(self):
+        # После fork дескриптор общий с родителем, поэтому процесс открывает архив заново
+        self._file = None
+        self._map = None
+
+    def __getstate__(self):
+        return {"path": self.path, "_file": None, "_map": None}
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+            self._file = None
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import re
+
+INLINE_BYTES = 1 << 20
+
+_reader = None
+_pattern = None
+_limit = None
+
+
+def _init_worker(reader, pattern, limit):
+    global _reader, _pattern, _limit
+    reader.detach()
+    _reader = reader
+    _pattern = pattern
+    _limit = limit
+
+
+def grep_member(reader, pattern, offset, size, limit=None):
+    """Строки файла, в которых есть совпадение; limit останавливает чтение после N найденных строк."""
+    lines = []
+    # Поиск идёт прямо по буферу архива. В bytes собираются только первая строка и строка на стыке
+    # блоков: перед ними в буфере нет перевода строки, и ^ в шаблоне на них бы не сработал
+    carry = b""
+    for buffer, start, stop in reader.iter_spans(offset, size):
+        cut = buffer.rfind(b"\n", start, stop) + 1
+        if not cut:
+            carry = (carry or b"") + buffer[start:stop]
+            continue
+        if carry is not None:
+            head = buffer.find(b"\n", start, stop) + 1
+            carry += buffer[start:head]
+            if _scan(pattern, carry, 0, len(carry), lines, limit):
+                return lines
+            start = head
+        if _scan(pattern, buffer, start, cut, lines, limit):
+            return lines
+        carry = buffer[cut:stop] if cut < stop else None
+    if carry:
+        _scan(pattern, carry, 0, len(carry), lines, limit)
+    return lines
+
+
+def _scan(pattern, data, begin, end, lines, limit):
+    # Ищем по всему участку [begin, end) сразу, а строку вырезаем только вокруг совпадения
+    position = begin
+    while position < end:
+        match = pattern.search(data, position, end)
+        # Пустое совпадение сразу после последнего перевода строки участка относится уже к следующей строке
+        if match is None or match.start() == end and data[end - 1] == 10:
+            return False
+        start = max(data.rfind(b"\n", begin, match.start()) + 1, begin)
+        stop = data.find(b"\n", match.end(), end)
+        if stop == -1:
+            stop = end
+        lines.append(data[start:stop].rstrip(b"\n").decode("utf-8", "replace"))
+        if limit is not None and len(lines) >= limit:
+            return True
+        position = stop + 1
+    return False
+
+
+def _grep_batch(batch):
+    return [(name, grep_member(_reader, _pattern, offset, size, _limit)) for name, offset, size in batch]
+
+
+def _batches(members, jobs):
+    target = max(sum(size for _, _, size in members) // (jobs * 4), 1)
+    batch = []
+    batch_size = 0
+    for member in members:
+        batch.append(member)
+        batch_size += member[2]
+        if batch_size >= target:
+            yield batch
+            batch = []
+            batch_size = 0
+    if batch:
+        yield batch
+
+
+def grep(reader, pattern, members, jobs=None, limit=None):
+    """Параллельный поиск по файлам архива; результаты приходят в порядке архива."""
+    members = sorted(members, key=lambda member: member[1])
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or sum(size for _, _, size in members) < INLINE_BYTES:
+        for name, offset, size in members:
+            yield name, grep_member(reader, pattern, offset, size, limit)
+        return
+
+    with multiprocessing.Pool(jobs, _init_worker, (reader, pattern, limit)) as pool:
+        for result in pool.imap(_grep_batch, _batches(members, jobs)):
+            yield from result
+
+
+def compile_pattern(pattern):
+    return re.compile(pattern.encode("utf-8"), re.MULTILINE)
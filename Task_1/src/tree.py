@@ -0,0 +1,145 @@
+import functools
+import sys
+import tarfile
+
+
+def split_path(name):
+    return [part for part in name.split("/") if part and part != "."]
+
+
+@functools.lru_cache(maxsize=4096)
+def resolve(cwd, argument):
+    """Нормализует путь относительно cwd в кортеж имён; результат зависит только от аргументов и кэшируется."""
+    parts = [] if argument.startswith("/") else list(cwd)
+    for part in argument.split("/"):
+        if not part or part == ".":
+            continue
+        if part == "..":
+            if parts:
+                parts.pop()
+        else:
+            parts.append(sys.intern(part))
+    return tuple(parts)
+
+
+class Node:
+    __slots__ = ("name", "is_dir", "size", "offset", "parent", "children", "files", "total")
+
+    def __init__(self, name, is_dir, size=0, parent=None, offset=None):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.offset = offset
+        self.parent = parent
+        self.children = {} if is_dir else None
+        # Число файлов и суммарный размер поддерева, для файла - он сам
+        self.files = 0 if is_dir else 1
+        self.total = 0 if is_dir else size
+
+
+class FileTree:
+    """Дерево каталогов архива: читается один раз, дальше все поиски идут по словарям детей."""
+
+    def __init__(self):
+        self.root = Node("", True)
+
+    @classmethod
+    def from_tar(cls, path):
+        with tarfile.open(path, "r") as tar:
+            return cls.from_entries(
+                (member.name, member.isdir(), member.size, member.offset_data) for member in tar)
+
+    @classmethod
+    def from_entries(cls, entries):
+        tree = cls()
+        for name, is_dir, size, offset in entries:
+            tree.add(name, is_dir, size, offset)
+        return tree
+
+    def entries(self):
+        stack = [("", self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            for child in node.children.values():
+                name = prefix + child.name
+                yield name, child.is_dir, child.size, child.offset
+                if child.is_dir:
+                    stack.append((name + "/", child))
+
+    def get(self, name):
+        node = self.root
+        for part in split_path(name):
+            if not node.is_dir:
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def home(self, name=None):
+        """Корень оболочки: единственный каталог верхнего уровня с именем архива (./file_system/
+        в file_system.tar), иначе корень самого архива."""
+        only = self.root.children.get(name) if name else None
+        if only is not None and only.is_dir and len(self.root.children) == 1:
+            return only, (only.name,)
+        return self.root, ()
+
+    @staticmethod
+    def descend(node, parts):
+        for part in parts:
+            if not node.is_dir:
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def add(self, name, is_dir=False, size=0, offset=None):
+        parts = split_path(name)
+        node = self.root
+        for part in parts[:-1]:
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = Node(part, True, parent=node)
+            node = child
+        if not parts:
+            return node
+
+        # Повторная запись в tar перекрывает предыдущую с тем же именем
+        child = node.children.get(parts[-1])
+        if child is None:
+            child = node.children[parts[-1]] = Node(parts[-1], is_dir, size, node, offset)
+            self._propagate(node, child.files, child.total)
+            return child
+        files, total = child.files, child.total
+        if child.is_dir != is_dir:
+            child.is_dir = is_dir
+            child.children = {} if is_dir else None
+            child.files = child.total = 0
+        if not is_dir:
+            child.files = 1
+            child.total = size
+        child.size = size
+        child.offset = offset
+        self._propagate(node, child.files - files, child.total - total)
+        return child
+
+    @staticmethod
+    def _propagate(node, files, total):
+        if not files and not total:
+            return
+        while node is not None:
+            node.files += files
+            node.total += total
+            node = node.parent
+
+
+def walk(node, path):
+    """Обход поддерева в глубину в порядке архива: пары (путь, узел)."""
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        yield path, node
+        if node.is_dir:
+            prefix = path if path.endswith("/") else path + "/"
+            stack.extend((prefix + name, child) for name, child in reversed(node.children.items()))
@@ -1,11 +1,32 @@
+import io
+import os
+import pickle
+import shutil
 import tarfile
+import tempfile
 import unittest
+from unittest.mock import patch
 from Task_1.main import BashFake
+from Task_1.src import index
+from Task_1.src.output import BufferedOutput
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "file_system.tar")
 
 
 class TastBashFake(unittest.TestCase):
     def setUp(self):
-        self.not_bash = BashFake()
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        shutil.copy(FIXTURE, self.tmp.name)
+        with open(os.path.join(self.tmp.name, "config.csv"), "w") as config:
+            config.write("file_system,./file_system.tar\nstart_script,\n")
+        os.chdir(self.tmp.name)
+        self.output = io.StringIO()
+        self.not_bash = BashFake("config.csv", BufferedOutput(self.output))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
 
     def test_ls_normal(self):
         result = self.not_bash._ls()
@@ -22,6 +43,49 @@ class TastBashFake(unittest.TestCase):
         self.assertIn("file.txt", result)
         self.assertIn("file2.txt", result)
 
+    def test_cat_file(self):
+        result = self.not_bash._cat(["home/user/file.txt"])
+        self.assertEqual(result, "Строка 1\nСтрока 2\nСтрока 3")
+
+    def test_cat_directory(self):
+        self.assertEqual(self.not_bash._cat(["home"]), "Is a directory")
+
+    def test_head_and_wc(self):
+        self.assertEqual(self.not_bash._head("home/user/file.txt", 1), "Строка 1")
+        self.assertEqual(self.not_bash._head("home/user/file.txt", 0), "")
+        self.assertEqual(self.not_bash._wc("home/user/file.txt"), "2 6 44 home/user/file.txt")
+
+    def test_chunks_are_views_into_archive(self):
+        node = self.not_bash._node("home/user/file.txt")
+        chunks = list(self.not_bash.reader.iter_chunks(node, 7))
+        self.assertTrue(all(isinstance(chunk, memoryview) for chunk in chunks))
+        self.assertEqual(b"".join(chunks), "Строка 1\nСтрока 2\nСтрока 3".encode())
+        # Первая строка файла в архиве не начинается после перевода строки, но ^ на ней срабатывает
+        self.assertEqual(list(self.not_bash._grep(["^Строка", "home/user/file.txt"]))[:1], ["Строка 1"])
+
+    def test_find_by_name(self):
+        result = self.not_bash._find([".", "-name", "*.txt"]).split("\n")
+        self.assertEqual(result, ["./home/user/file.txt", "./home/user/file2.txt"])
+
+    def test_du_aggregates_after_touch(self):
+        self.assertEqual(self.not_bash._du(["-s", "home"]), "66\thome")
+        self.not_bash._touch("home/user/empty.txt")
+        self.assertEqual(self.not_bash.tree.get("./file_system/home").files, 4)
+        self.assertEqual(self.not_bash._du(["-s", "home"]), "66\thome")
+
+    def test_tree(self):
+        result = self.not_bash._tree("home").split("\n")
+        self.assertEqual(result[:4], ["home", "├── user", "│   ├── file.txt", "│   └── file2.txt"])
+
+    def test_grep_recursive(self):
+        result = list(self.not_bash._grep(["-r", "-m", "2", "Строка", "home"]))
+        self.assertEqual(result, ["home/user/file.txt:Строка 1", "home/user/file.txt:Строка 2"])
+
+    def test_grep_process_pool(self):
+        with patch("src.search.INLINE_BYTES", 0):
+            result = list(self.not_bash._grep(["-r", "-l", "-j", "2", "root|Строка", "/"]))
+        self.assertEqual(result, ["/etc/passwd", "/home/user/file.txt"])
+
     def test_cd_valid(self):
         self.not_bash._cd("empty")
         self.assertEqual(self.not_bash.path, "./file_system/empty/")
@@ -30,6 +94,14 @@ class TastBashFake(unittest.TestCase):
         result = self.not_bash._cd("invalid_dir")
         self.assertEqual(result, "No such directory")
 
+    def test_cd_relative_components(self):
+        self.not_bash._cd("home/user/../user/./")
+        self.assertEqual(self.not_bash.path, "./file_system/home/user/")
+        self.not_bash._cd("../../../etc")
+        self.assertEqual(self.not_bash.cwd, ("etc",))
+        self.assertEqual(self.not_bash._cd("/home/nope"), "No such directory")
+        self.assertEqual(self.not_bash.cwd, ("etc",))
+
     def test_cd_to_root(self):
         self.not_bash.path = "./file_system/home/user/"
         self.not_bash._cd("/")
@@ -38,13 +110,129 @@ class TastBashFake(unittest.TestCase):
     def test_touch_create_file(self):
         self.not_bash.path = "./file_system/"
         self.not_bash._touch("new_file.txt")
+        self.not_bash._sync()
+        with tarfile.open(self.not_bash.config["file_system"], "r") as tar:
+            self.assertTrue("./file_system/new_file.txt" in [member.name for member in tar.getmembers()])
+
+    def test_touch_is_deferred_until_sync(self):
+        self.not_bash.path = "./file_system/"
+        self.not_bash._touch("deferred_file.txt")
+        self.assertEqual(len(self.not_bash.journal.pending), 1)
+        self.assertIn("deferred_file.txt", self.not_bash._ls())
+        self.not_bash._sync()
+        self.assertEqual(self.not_bash.journal.pending, [])
         with tarfile.open(self.not_bash.config["file_system"], "r") as tar:
-            self.assertTrue("new_file.txt" in [member.name for member in tar.getmembers()])
+            self.assertIn("./file_system/deferred_file.txt", tar.getnames())
+
+    def test_touch_updates_index(self):
+        self.not_bash.path = "./file_system/"
+        self.not_bash._touch("indexed_file.txt")
+        self.assertIn("indexed_file.txt", self.not_bash._ls().split("\n"))
+        self.assertFalse(self.not_bash.tree.get("./file_system/indexed_file.txt").is_dir)
 
     def test_touch_no_args(self):
         self.not_bash.path = "./file_system/"
         self.assertEqual(self.not_bash._touch(""), "No file name")
 
+    def test_archive_without_wrapper_directory(self):
+        with tarfile.open("plain.tar", "w") as tar:
+            info = tarfile.TarInfo("home/user/f.txt")
+            info.size = 2
+            tar.addfile(info, io.BytesIO(b"f\n"))
+        with open("plain.csv", "w") as config:
+            config.write("file_system,plain.tar\nstart_script,\n")
+        not_bash = BashFake("plain.csv", BufferedOutput(self.output))
+        self.assertEqual(not_bash._ls("/"), "home")
+        self.assertIsNone(not_bash._cd("/home"))
+        self.assertEqual(not_bash._cat(["user/f.txt"]), "f")
+
+    def test_headless_script(self):
+        self.not_bash.run_script(["cd home/user", "ls", "exit", "ls"])
+        self.assertEqual(self.output.getvalue().split("\n")[:2], ["file.txt", "file2.txt"])
+        self.assertEqual(self.output.getvalue().count("file.txt"), 1)
+
+
+class _Planted:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return open, (self.marker, "w")
+
+
+class TestArchiveIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.tmp.name, "file_system.tar.gz")
+        self.data = b"line one\nline two\n" * 1000
+        with tarfile.open(self.archive, "w:gz") as tar:
+            info = tarfile.TarInfo("./file_system/data.txt")
+            info.size = len(self.data)
+            tar.addfile(info, io.BytesIO(self.data))
+
+        cache = patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache_home")})
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sidecar_reused(self):
+        index.open_archive(self.archive)
+        self.assertIsNotNone(index.load_index(self.archive))
+        tree, reader, compressed = index.open_archive(self.archive)
+        self.assertEqual(compressed, "gz")
+        self.assertEqual(bytes(reader.read(tree.get("file_system/data.txt"))), self.data)
+
+    def test_foreign_index_is_rescanned(self):
+        for payload in (pickle.dumps([1, 2]), b"cno_such_module\nThing\n.", b"[1, 2]", b"\xff{"):
+            with open(self.archive + ".idx", "wb") as file:
+                file.write(payload)
+            self.assertIsNone(index.load_index(self.archive))
+            tree, reader, _ = index.open_archive(self.archive)
+            self.assertEqual(bytes(reader.read(tree.get("file_system/data.txt"))), self.data)
+
+    def test_cached_index_is_not_unpickled(self):
+        # Рядом с архивом индекса нет, поэтому читается файл из кэша
+        marker = os.path.join(self.tmp.name, "executed")
+        planted = list(index.sidecar_paths(self.archive, ".idx"))[-1]
+        self.assertEqual(os.stat(os.path.dirname(planted)).st_mode & 0o777, 0o700)
+        with open(planted, "wb") as file:
+            file.write(pickle.dumps(_Planted(marker)))
+        self.assertIsNone(index.load_index(self.archive))
+        tree, reader, _ = index.open_archive(self.archive)
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(bytes(reader.read(tree.get("file_system/data.txt"))), self.data)
+
+    def test_shared_cache_directory_is_refused(self):
+        os.makedirs(os.path.join(self.tmp.name, "cache_home", "bashfake"), mode=0o777)
+        os.chmod(os.path.join(self.tmp.name, "cache_home", "bashfake"), 0o777)
+        with self.assertRaises(OSError):
+            index.cache_dir()
+        self.assertEqual(list(index.sidecar_paths(self.archive, ".idx")), [self.archive + ".idx"])
+
+    def test_read_only_directory(self):
+        # Вместо каталога архива - путь внутри обычного файла, куда ничего не записать
+        blocked = os.path.join(self.archive, "sidecar")
+        fallback = os.path.join(self.tmp.name, "cache", "sidecar")
+        with patch.object(index, "sidecar_paths",
+                          side_effect=lambda archive, suffix: (blocked + suffix, fallback + suffix)):
+            index.open_archive(self.archive)
+            self.assertTrue(os.path.exists(fallback + ".blk"))
+            self.assertIsNotNone(index.load_index(self.archive))
+            tree, reader, _ = index.open_archive(self.archive)
+        self.assertEqual(bytes(reader.read(tree.get("file_system/data.txt"))), self.data)
+
+    def test_read_across_checkpoints(self):
+        old_size = index.BLOCK_SIZE
+        index.BLOCK_SIZE = 1024
+        try:
+            tree, reader, _ = index.open_archive(self.archive)
+        finally:
+            index.BLOCK_SIZE = old_size
+        node = tree.get("file_system/data.txt")
+        self.assertEqual(b"".join(reader.iter_chunks(node, 100)), self.data)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,53 @@
+"""Замер времени запуска main.py: чистый импорт, путь только с Mermaid и путь с рисованием.
+
+Пример:
+    python benchmarks/bench_startup.py --repeat 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+TASK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    # Импорт модуля и разбор аргументов, как при запуске с --mode mermaid
+    "import_main": "import main",
+    "mermaid_path": "import main, io; main.write_mermaid(main.build_branch_file_graph("
+                    "[('c', 'd', 'a', ['f'])], {'c': ['main']}), io.StringIO())",
+    # То, что дополнительно загружается при --mode plot
+    "plot_path": "import main, render, matplotlib.figure, networkx",
+}
+
+
+def measure(code, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=TASK_DIR, check=True)
+        samples.append(time.perf_counter() - start)
+    return {"min_s": min(samples), "median_s": statistics.median(samples), "max_s": max(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска Task_2 в отдельном интерпретаторе")
+    parser.add_argument("--repeat", type=int, default=5, help="запусков на сценарий")
+    parser.add_argument("--output", help="куда записать JSON, по умолчанию stdout")
+    args = parser.parse_args()
+
+    baseline = measure("pass", args.repeat)
+    report = {"python": sys.version.split()[0], "interpreter": baseline}
+    report.update((name, measure(code, args.repeat)) for name, code in SCENARIOS.items())
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
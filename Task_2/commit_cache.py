@@ -0,0 +1,43 @@
+import hashlib
+import os
+import pickle
+
+CACHE_VERSION = 3
+
+
+class CommitCache:
+    """Обработанные коммиты, списки файлов и принадлежность веткам между запусками визуализатора."""
+
+    def __init__(self, cache_dir, repo, commit_date):
+        key = hashlib.sha1(f"{repo}\0{commit_date}".encode("utf-8")).hexdigest()
+        self.path = os.path.join(cache_dir, f"{key}.pickle")
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if data.get("version") != CACHE_VERSION:
+            return None
+        return data
+
+    def save(self, head, tips, commits, commit_branches):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            "version": CACHE_VERSION,
+            "head": head,
+            "tips": tips,
+            "commits": commits,
+            "branches": commit_branches,
+        }
+        # Пишем во временный файл, чтобы прерванный запуск не оставил битый кэш
+        with open(self.path + ".tmp", "wb") as file:
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + ".tmp", self.path)
+
+    def invalidate(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,538 @@
+import glob
+import heapq
+import itertools
+import mmap
+import os
+import re
+import struct
+import subprocess
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+OBJECT_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+OFS_DELTA = 6
+REF_DELTA = 7
+TREE_MODE = b'40000'
+# Запись дерева: "<режим> <имя>\0<20 байт хеша>"
+TREE_ENTRY = re.compile(rb'(\d+) ([^\0]*)\0(.{20})', re.DOTALL)
+
+
+class GitObjectError(Exception):
+    pass
+
+
+def _varint_size(data, position):
+    # Размер в заголовке дельты: 7 бит на байт, младшие группы первыми
+    size = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return size, position
+
+
+def apply_delta(base, delta):
+    _, position = _varint_size(delta, 0)
+    result_size, position = _varint_size(delta, position)
+    result = bytearray()
+    end = len(delta)
+    while position < end:
+        command = delta[position]
+        position += 1
+        if command & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if command & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if command & (0x10 << i):
+                    size |= delta[position] << (8 * i)
+                    position += 1
+            result += base[offset:offset + (size or 0x10000)]
+        elif command:
+            result += delta[position:position + command]
+            position += command
+        else:
+            raise GitObjectError("Некорректная инструкция в дельте")
+    if len(result) != result_size:
+        raise GitObjectError("Размер объекта после дельты не совпадает с заголовком")
+    return bytes(result)
+
+
+class PackIndex:
+    """Индекс .idx версии 1 или 2, отображённый в память; поиск по таблице fanout и бинарным поиском."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] == b'\377tOc':
+            if struct.unpack_from('>I', self.data, 4)[0] != 2:
+                raise GitObjectError(f"Неподдерживаемая версия индекса {path}")
+            self.version = 2
+            fanout = 8
+        else:
+            self.version = 1
+            fanout = 0
+        self.fanout = struct.unpack_from('>256I', self.data, fanout)
+        self.count = self.fanout[255]
+        table = fanout + 256 * 4
+        if self.version == 2:
+            self.names = table
+            self.offsets = table + self.count * 24
+            self.large_offsets = self.offsets + self.count * 4
+        else:
+            self.names = table + 4
+
+    def _name(self, i):
+        if self.version == 2:
+            start = self.names + i * 20
+        else:
+            start = self.names + i * 24
+        return self.data[start:start + 20]
+
+    def find(self, binary_sha):
+        first = binary_sha[0]
+        low = self.fanout[first - 1] if first else 0
+        high = self.fanout[first]
+        while low < high:
+            middle = (low + high) // 2
+            name = self._name(middle)
+            if name < binary_sha:
+                low = middle + 1
+            elif name > binary_sha:
+                high = middle
+            else:
+                return self._offset(middle)
+        return None
+
+    def _offset(self, i):
+        if self.version == 1:
+            return struct.unpack_from('>I', self.data, self.names - 4 + i * 24)[0]
+        offset = struct.unpack_from('>I', self.data, self.offsets + i * 4)[0]
+        if offset & 0x80000000:
+            offset = struct.unpack_from('>Q', self.data, self.large_offsets + (offset & 0x7fffffff) * 8)[0]
+        return offset
+
+
+class Pack:
+    def __init__(self, idx_path):
+        self.index = PackIndex(idx_path)
+        with open(idx_path[:-4] + '.pack', 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def entry(self, offset):
+        """Заголовок записи в .pack: тип, размер, база дельты и начало сжатых данных."""
+        data = self.data
+        byte = data[offset]
+        kind = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        position = offset + 1
+        while byte & 0x80:
+            byte = data[position]
+            position += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        base = None
+        if kind == OFS_DELTA:
+            byte = data[position]
+            position += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = data[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = offset - distance
+        elif kind == REF_DELTA:
+            base = bytes(data[position:position + 20])
+            position += 20
+        return kind, size, base, position
+
+    def inflate(self, position, size):
+        decompressor = zlib.decompressobj()
+        step = max(size, 64)
+        result = []
+        while not decompressor.eof:
+            chunk = self.data[position:position + step]
+            if not chunk:
+                raise GitObjectError("Обрезанный pack-файл")
+            result.append(decompressor.decompress(chunk))
+            position += step
+        return b''.join(result)
+
+
+class Repository:
+    """Чтение .git без вызова git: ссылки, loose-объекты, pack-файлы, обход коммитов и сравнение деревьев."""
+
+    def __init__(self, path, cache_bytes=32 << 20, tree_cache=1 << 18):
+        git_dir = os.path.join(path, '.git')
+        if os.path.isfile(git_dir):
+            with open(git_dir) as file:
+                git_dir = os.path.join(path, file.read().split(':', 1)[1].strip())
+        if not os.path.isdir(git_dir):
+            git_dir = path
+        if not os.path.isfile(os.path.join(git_dir, 'HEAD')):
+            raise GitObjectError(f"Не найден git-репозиторий: {path}")
+        self.git_dir = git_dir
+        # У рабочего дерева из git worktree свои только HEAD и служебные ссылки,
+        # объекты, ветки и packed-refs лежат в общем каталоге из файла commondir
+        self.common_dir = git_dir
+        commondir = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(commondir):
+            with open(commondir) as file:
+                self.common_dir = os.path.normpath(os.path.join(git_dir, file.read().strip()))
+            if not os.path.isdir(os.path.join(self.common_dir, 'objects')):
+                raise GitObjectError(f"Не найден общий каталог репозитория: {self.common_dir}")
+        self._check_format()
+        self.packs = [Pack(idx) for idx in
+                      sorted(glob.glob(os.path.join(self.common_dir, 'objects', 'pack', '*.idx')))]
+        self.cache_bytes = cache_bytes
+        self._bases = OrderedDict()
+        self._bases_size = 0
+        # Разобранные деревья: дерево коммита ещё раз сравнивается как дерево родителя следующего.
+        # Размер кэша считается в записях деревьев
+        self.tree_cache = tree_cache
+        self._trees = OrderedDict()
+        self._trees_size = 0
+        self._commits = {}
+        # В неполном (--shallow-since) клоне родители граничных коммитов отсутствуют, как и в git, они считаются корнями
+        self.shallow = set()
+        shallow = os.path.join(self.common_dir, 'shallow')
+        if os.path.exists(shallow):
+            with open(shallow) as file:
+                self.shallow = set(file.read().split())
+
+    def _check_format(self):
+        text = ''
+        for config in (os.path.join(self.common_dir, 'config'), os.path.join(self.git_dir, 'config.worktree')):
+            if os.path.exists(config):
+                with open(config) as file:
+                    text += file.read().lower()
+        if 'objectformat' in text and 'sha256' in text or 'refstorage' in text and 'reftable' in text:
+            raise GitObjectError("Формат репозитория не поддерживается")
+
+    # Ссылки
+
+    def _packed_refs(self):
+        refs = {}
+        path = os.path.join(self.common_dir, 'packed-refs')
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    if line.startswith(('#', '^')):
+                        continue
+                    sha, _, name = line.strip().partition(' ')
+                    if name:
+                        refs[name] = sha
+        return refs
+
+    def _ref_path(self, name):
+        # Сначала каталог рабочего дерева (HEAD, refs/bisect), затем общий
+        for directory in dict.fromkeys((self.git_dir, self.common_dir)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def resolve(self, name):
+        for _ in range(10):
+            if len(name) == 40 and all(c in '0123456789abcdef' for c in name):
+                return name
+            for candidate in (name, f'refs/heads/{name}', f'refs/tags/{name}', f'refs/remotes/{name}'):
+                path = self._ref_path(candidate)
+                if path is not None:
+                    with open(path) as file:
+                        value = file.read().strip()
+                    break
+            else:
+                packed = self._packed_refs()
+                for candidate in (name, f'refs/heads/{name}', f'refs/tags/{name}', f'refs/remotes/{name}'):
+                    if candidate in packed:
+                        return self._peel(packed[candidate])
+                raise GitObjectError(f"Неизвестная ссылка: {name}")
+            if value.startswith('ref:'):
+                name = value[4:].strip()
+            else:
+                return self._peel(value)
+        raise GitObjectError(f"Слишком длинная цепочка символических ссылок: {name}")
+
+    def _peel(self, sha):
+        kind, data = self.read_object(sha)
+        while kind == 'tag':
+            sha = data.split(b'\n', 1)[0].split()[1].decode()
+            kind, data = self.read_object(sha)
+        return sha
+
+    def branch_tips(self):
+        refs = {name: sha for name, sha in self._packed_refs().items() if name.startswith('refs/heads/')}
+        heads = os.path.join(self.common_dir, 'refs', 'heads')
+        for directory, _, files in os.walk(heads):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                with open(path) as file:
+                    refs['refs/' + os.path.relpath(path, os.path.join(self.common_dir, 'refs')).replace(os.sep, '/')] = \
+                        file.read().strip()
+        return {name[len('refs/heads/'):]: refs[name] for name in sorted(refs)}
+
+    def head(self):
+        return self.resolve('HEAD')
+
+    # Объекты
+
+    def read_object(self, sha):
+        path = os.path.join(self.common_dir, 'objects', sha[:2], sha[2:])
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                raw = zlib.decompress(file.read())
+            header, _, data = raw.partition(b'\0')
+            return header.split(b' ', 1)[0].decode(), data
+        binary = bytes.fromhex(sha)
+        for pack in self.packs:
+            offset = pack.index.find(binary)
+            if offset is not None:
+                return self._read_packed(pack, offset)
+        raise GitObjectError(f"Объект не найден: {sha}")
+
+    def _read_packed(self, pack, offset):
+        # Цепочку дельт проходим итеративно до базового объекта, затем применяем дельты обратно
+        chain = []
+        while True:
+            cached = self._bases.get((id(pack), offset))
+            if cached is not None:
+                self._bases.move_to_end((id(pack), offset))
+                kind, data = cached
+                break
+            kind, size, base, position = pack.entry(offset)
+            if kind in OBJECT_TYPES:
+                kind, data = OBJECT_TYPES[kind], pack.inflate(position, size)
+                self._remember(pack, offset, kind, data)
+                break
+            chain.append((offset, pack.inflate(position, size)))
+            if kind == OFS_DELTA:
+                offset = base
+            else:
+                base_sha = base.hex()
+                base_offset = pack.index.find(base)
+                if base_offset is None:
+                    kind, data = self.read_object(base_sha)
+                    break
+                offset = base_offset
+        for delta_offset, delta in reversed(chain):
+            data = apply_delta(data, delta)
+            self._remember(pack, delta_offset, kind, data)
+        return kind, data
+
+    def _remember(self, pack, offset, kind, data):
+        key = (id(pack), offset)
+        if key in self._bases or len(data) > self.cache_bytes // 4:
+            return
+        self._bases[key] = (kind, data)
+        self._bases_size += len(data)
+        while self._bases_size > self.cache_bytes:
+            _, (_, old) = self._bases.popitem(last=False)
+            self._bases_size -= len(old)
+
+    # Коммиты и деревья
+
+    def commit(self, sha):
+        """(дерево, родители, время коммита, часовой пояс, автор) с кэшированием разобранных коммитов."""
+        parsed = self._commits.get(sha)
+        if parsed is None:
+            kind, data = self.read_object(sha)
+            if kind != 'commit':
+                raise GitObjectError(f"{sha} не является коммитом")
+            tree = None
+            parents = []
+            author = ''
+            timestamp, tz = 0, '+0000'
+            for line in data.split(b'\n\n', 1)[0].split(b'\n'):
+                key, _, value = line.partition(b' ')
+                if key == b'tree':
+                    tree = value.decode()
+                elif key == b'parent':
+                    parents.append(value.decode())
+                elif key == b'author':
+                    author = value.rsplit(b'<', 1)[0].strip().decode('utf-8', 'replace')
+                elif key == b'committer':
+                    stamp, tz = value.rsplit(b' ', 2)[1:]
+                    timestamp, tz = int(stamp), tz.decode()
+            if sha in self.shallow:
+                parents = []
+            parsed = self._commits[sha] = (tree, tuple(parents), timestamp, tz, author)
+        return parsed
+
+    def tree(self, sha):
+        _, data = self.read_object(sha)
+        return [(name.decode('utf-8', 'replace'), mode, binary.hex()) for mode, name, binary in TREE_ENTRY.findall(data)]
+
+    def _tree_entries(self, sha):
+        entries = self._trees.get(sha)
+        if entries is not None:
+            self._trees.move_to_end(sha)
+            return entries
+        entries = self._trees[sha] = {name: (mode, child) for name, mode, child in self.tree(sha)}
+        self._trees_size += len(entries)
+        while self._trees_size > self.tree_cache:
+            _, old = self._trees.popitem(last=False)
+            self._trees_size -= len(old)
+        return entries
+
+    def diff_trees(self, old, new, prefix=''):
+        """Пути, которые отличаются между двумя деревьями содержимым или режимом (например, chmod +x);
+        одинаковые поддеревья пропускаются по хешу."""
+        if old == new:
+            return {}
+        old_entries = self._tree_entries(old) if old else {}
+        new_entries = self._tree_entries(new) if new else {}
+        changes = {}
+        for name in sorted(old_entries.keys() | new_entries.keys()):
+            old_mode, old_sha = old_entries.get(name, (None, None))
+            new_mode, new_sha = new_entries.get(name, (None, None))
+            if old_sha == new_sha and old_mode == new_mode:
+                continue
+            path = prefix + name
+            old_dir, new_dir = old_mode == TREE_MODE, new_mode == TREE_MODE
+            if old_dir or new_dir:
+                changes.update(self.diff_trees(old_sha if old_dir else None, new_sha if new_dir else None,
+                                               path + '/'))
+                if old_sha and not old_dir:
+                    changes[path] = (old_sha, None)
+                if new_sha and not new_dir:
+                    changes[path] = (None, new_sha)
+            else:
+                changes[path] = (old_sha, new_sha)
+        return changes
+
+    def changed_files(self, sha):
+        tree, parents, *_ = self.commit(sha)
+        if not parents:
+            changes = self.diff_trees(None, tree)
+        else:
+            # Для слияний, как в --cc, остаются файлы, отличающиеся от всех родителей
+            changes = None
+            for parent in parents:
+                diff = self.diff_trees(self.commit(parent)[0], tree)
+                changes = diff if changes is None else {path: diff[path] for path in changes if path in diff}
+        # Переименование - это удаление и добавление, как в git log --no-renames у GitCli
+        return sorted(changes, key=_path_key)
+
+    # Обход истории
+
+    def _revisions(self, revisions):
+        include, exclude = [], []
+        target = include
+        for revision in revisions:
+            if revision == '--not':
+                target = exclude if target is include else include
+            else:
+                target.append(self.resolve(revision))
+        return include or [self.head()], exclude
+
+    def _ancestors(self, starts):
+        seen = set()
+        stack = list(starts)
+        while stack:
+            sha = stack.pop()
+            if sha in seen:
+                continue
+            seen.add(sha)
+            stack.extend(self.commit(sha)[1])
+        return seen
+
+    def rev_list(self, *revisions, since=None):
+        include, exclude = self._revisions(revisions)
+        excluded = self._ancestors(exclude)
+        seen = set()
+        # Коммиты с одинаковым временем выходят в порядке добавления в очередь, как в git log
+        order = itertools.count()
+        queue = []
+        for sha in include:
+            if sha not in seen:
+                seen.add(sha)
+                queue.append((-self.commit(sha)[2], next(order), sha))
+        heapq.heapify(queue)
+        while queue:
+            negative_time, _, sha = heapq.heappop(queue)
+            if since is not None and -negative_time < since:
+                break
+            if sha in excluded:
+                continue
+            yield sha
+            for parent in self.commit(sha)[1]:
+                if parent not in seen:
+                    seen.add(parent)
+                    heapq.heappush(queue, (-self.commit(parent)[2], next(order), parent))
+
+    def is_ancestor(self, sha, descendant):
+        try:
+            return self.resolve(sha) in self._ancestors([self.resolve(descendant)])
+        except GitObjectError:
+            return False
+
+    def commits(self, commit_date, revisions=()):
+        """То же, что get_commits: (хеш, дата в формате --date=iso, автор, файлы, родители) от новых к старым."""
+        for sha in self.rev_list(*revisions, since=since_timestamp(commit_date, self.git_dir)):
+            _, parents, timestamp, tz, author = self.commit(sha)
+            yield sha, format_date(timestamp, tz), author, self.changed_files(sha), parents
+
+    def commit_branches(self):
+        tips = self.branch_tips()
+        if not tips:
+            return {}
+        branch_names = list(tips)
+        masks = {}
+        for i, sha in enumerate(tips.values()):
+            masks[sha] = masks.get(sha, 0) | 1 << i
+        # Топологический порядок: коммит обрабатывается после всех своих потомков
+        reachable = self._ancestors(masks)
+        children = dict.fromkeys(reachable, 0)
+        for sha in reachable:
+            for parent in self.commit(sha)[1]:
+                children[parent] += 1
+        ready = [sha for sha, count in children.items() if not count]
+        while ready:
+            sha = ready.pop()
+            mask = masks.get(sha, 0)
+            for parent in self.commit(sha)[1]:
+                masks[parent] = masks.get(parent, 0) | mask
+                children[parent] -= 1
+                if not children[parent]:
+                    ready.append(parent)
+        names = {}
+        commit_branches = {}
+        for sha, mask in masks.items():
+            if mask not in names:
+                names[mask] = [branch for i, branch in enumerate(branch_names) if mask >> i & 1]
+            commit_branches[sha] = names[mask]
+        return commit_branches
+
+
+def _path_key(path):
+    return path.encode('utf-8')
+
+
+def since_timestamp(commit_date, repo_dir='.'):
+    # Как approxidate в git: дата без времени берётся с текущим временем суток
+    try:
+        moment = datetime.fromisoformat(commit_date.strip())
+    except ValueError:
+        # Остальные форматы git log --after ("01.01.2024", "2 weeks ago") разбирает сам git
+        try:
+            output = subprocess.check_output(['git', '-C', repo_dir, 'rev-parse', f'--since={commit_date}'],
+                                             text=True, stderr=subprocess.DEVNULL)
+            return int(output.strip().partition('=')[2])
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            raise GitObjectError(f"Не удалось разобрать дату '{commit_date}'") from None
+    if len(commit_date.strip()) == 10:
+        moment = datetime.combine(moment.date(), datetime.now().time())
+    return moment.timestamp()
+
+
+def format_date(timestamp, tz):
+    sign = -1 if tz.startswith('-') else 1
+    offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * sign
+    return datetime.fromtimestamp(timestamp, timezone(offset)).strftime('%Y-%m-%d %H:%M:%S ') + tz
@@ -0,0 +1,157 @@
+from array import array
+from enum import IntEnum
+
+import numpy as np
+
+
+class NodeKind(IntEnum):
+    DATE = 0
+    BRANCH = 1
+    COMMIT = 2
+    FILE = 3
+    OTHER = 4
+
+
+PREFIXES = {NodeKind.DATE: 'date_', NodeKind.BRANCH: 'branch_', NodeKind.COMMIT: 'commit_', NodeKind.FILE: 'file_'}
+DEFAULT_LABELS = {NodeKind.BRANCH: 'Ветка: {}', NodeKind.FILE: 'File: {}'}
+
+
+class GraphStore:
+    """Граф с целочисленными узлами: таблицы имён по видам, массив видов и рёбра в формате CSR."""
+
+    def __init__(self):
+        self._ids = {kind: {} for kind in NodeKind}
+        self.keys = []
+        # None - подпись по умолчанию для вида узла, чтобы не хранить строку на каждый файл
+        self.labels = []
+        self._kinds = array('B')
+        self._sources = array('i')
+        self._targets = array('i')
+        self._csr = None
+        # Хеш коммита -> хеши родителей; рёбер в графе для них нет
+        self.parents = {}
+
+    @classmethod
+    def from_networkx(cls, G):
+        store = cls()
+        ids = {}
+        for node, data in G.nodes(data=True):
+            kind, key = split_name(str(node))
+            ids[node] = store.add_node(kind, key, data.get('label'))
+        for source, target in G.edges:
+            store.add_edge(ids[source], ids[target])
+        return store
+
+    def add_node(self, kind, key, label=None):
+        ids = self._ids[kind]
+        node = ids.get(key)
+        if node is None:
+            node = ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.labels.append(label)
+            self._kinds.append(kind)
+        elif label is not None:
+            self.labels[node] = label
+        return node
+
+    def add_edge(self, source, target):
+        self._sources.append(source)
+        self._targets.append(target)
+        self._csr = None
+
+    @property
+    def kinds(self):
+        # Копия, а не вид на буфер: иначе array нельзя будет дополнять, пока вид жив
+        return np.array(self._kinds, dtype=np.uint8)
+
+    @property
+    def nodes(self):
+        return range(len(self.keys))
+
+    def number_of_nodes(self):
+        return len(self.keys)
+
+    def number_of_edges(self):
+        return len(self.csr()[1])
+
+    def node_id(self, name):
+        kind, key = split_name(name)
+        return self._ids[kind].get(key)
+
+    def kind(self, node):
+        return NodeKind(self._kinds[node])
+
+    def name(self, node):
+        return PREFIXES.get(self.kind(node), '') + self.keys[node]
+
+    def label(self, node):
+        label = self.labels[node]
+        if label is None:
+            label = DEFAULT_LABELS.get(self.kind(node), 'No label available').format(self.keys[node])
+        return label
+
+    def csr(self):
+        # Рёбра сортируются по источнику, повторы схлопываются, как в DiGraph
+        if self._csr is None:
+            count = len(self.keys)
+            sources = np.array(self._sources, dtype=np.int64)
+            targets = np.array(self._targets, dtype=np.int64)
+            codes = np.unique(sources * max(count, 1) + targets)
+            sources, indices = np.divmod(codes, max(count, 1))
+            indptr = np.zeros(count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+            self._csr = indptr, indices.astype(np.int32)
+        return self._csr
+
+    def successors(self, node):
+        indptr, indices = self.csr()
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def edges(self):
+        indptr, indices = self.csr()
+        for source in range(len(self.keys)):
+            for target in indices[indptr[source]:indptr[source + 1]]:
+                yield source, int(target)
+
+    def edge_arrays(self):
+        indptr, indices = self.csr()
+        return np.repeat(np.arange(len(self.keys), dtype=np.int32), np.diff(indptr)), indices
+
+    def has_node(self, name):
+        return self.node_id(name) is not None
+
+    def has_edge(self, source, target):
+        source, target = self.node_id(source), self.node_id(target)
+        if source is None or target is None:
+            return False
+        return bool(np.any(self.successors(source) == target))
+
+    def layout(self, scale=1.5):
+        """Расположение по уровням видов узлов: x - номер уровня, y - равномерно внутри уровня.
+
+        Оси нормируются отдельно, чтобы уровень из сотен тысяч файлов не сжимал граф по x.
+        """
+        kinds = self.kinds
+        positions = np.zeros((len(kinds), 2))
+        present = np.unique(kinds)
+        for level, kind in enumerate(present):
+            members = np.flatnonzero(kinds == kind)
+            positions[members, 0] = 2 * level / (len(present) - 1) - 1 if len(present) > 1 else 0
+            positions[members, 1] = np.linspace(1, -1, len(members)) if len(members) > 1 else 0
+        return positions * scale
+
+    def to_networkx(self):
+        import networkx as nx
+
+        G = nx.DiGraph()
+        for node in self.nodes:
+            G.add_node(self.name(node), label=self.label(node), subset=int(self._kinds[node]))
+        G.add_edges_from((self.name(source), self.name(target)) for source, target in self.edges())
+        return G
+
+
+def split_name(name):
+    for kind, prefix in PREFIXES.items():
+        if name.startswith(prefix):
+            return kind, name[len(prefix):]
+    return NodeKind.OTHER, name
@@ -1,120 +1,353 @@
+import argparse
+import io
 import os
+import sys
 import configparser
 import subprocess
-import networkx as nx
-from networkx.drawing.nx_agraph import graphviz_layout
-import matplotlib.pyplot as plt
+from commit_cache import CommitCache
+from git_objects import GitObjectError, Repository, since_timestamp
+from graph_store import GraphStore, NodeKind
+from mermaid import write_mermaid
+import profiling
 
+# matplotlib и networkx импортируются только там, где рисуется граф:
+# для вывода одного Mermaid-текста они не нужны, а загружаются около секунды
 
-def read_config(config_path):
+
+def load_config(config_path):
     config = configparser.ConfigParser()
     config.read(config_path)
+    return config
+
+
+# Функции чтения секций принимают путь или уже прочитанный ConfigParser, чтобы файл читался один раз
+
+def read_config(config):
+    if not isinstance(config, configparser.ConfigParser):
+        config = load_config(config)
     visualizer_path = config.get('DATA', 'visualizer_path')
     repo_path = config.get('DATA', 'repo_path')
     commit_date = config.get('DATA', 'commit_date')
     return visualizer_path, repo_path, commit_date
 
 
-def clone_repository(repo_url, target_dir):
+def read_mermaid_options(config):
+    # Необязательная секция [MERMAID]: depth, max_files, merge_chains
+    if not isinstance(config, configparser.ConfigParser):
+        config = load_config(config)
+    return {
+        'depth': config.getint('MERMAID', 'depth', fallback=None),
+        'max_files': config.getint('MERMAID', 'max_files', fallback=None),
+        'merge_chains': config.getboolean('MERMAID', 'merge_chains', fallback=False),
+    }
+
+
+def read_render_options(config):
+    # Необязательная секция [RENDER]: output - файл .svg/.png вместо окна, top_commits - число подписанных коммитов
+    if not isinstance(config, configparser.ConfigParser):
+        config = load_config(config)
+    return {
+        'output': config.get('RENDER', 'output', fallback=None),
+        'top_commits': config.getint('RENDER', 'top_commits', fallback=20),
+    }
+
+
+CACHE_DIR = '.git_graph_cache'
+
+
+def shallow_since(commit_date):
+    # Дата без времени берётся с начала суток, чтобы граница клона не зависела от времени запуска
+    return f"{commit_date.strip()} 00:00" if len(commit_date.strip()) == 10 else commit_date
+
+
+def needs_deepen(target_dir, commit_date):
+    """Есть ли граничный коммит неполного клона не старше commit_date, то есть без нужных родителей."""
     try:
-        subprocess.run(['git', 'clone', repo_url, target_dir], check=True)
+        with open(os.path.join(target_dir, 'shallow')) as file:
+            boundary = file.read().split()
+    except FileNotFoundError:
+        return False
+    if not boundary:
+        return False
+    times = subprocess.check_output(['git', '-C', target_dir, 'show', '-s', '--format=%ct', *boundary], text=True)
+    return any(int(stamp) >= since_timestamp(commit_date, target_dir) for stamp in times.split())
+
+
+def run_shallow(command, fallback=None):
+    """Запускает git с --shallow-since. Если после даты нет ни одного коммита, git отказывает
+    ("no commits selected for shallow requests") - тогда выполняется fallback, и функция возвращает False.
+    """
+    result = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+    if result.returncode and 'no commits selected for shallow requests' in result.stderr:
+        if fallback:
+            subprocess.run(fallback, check=True)
+        return False
+    sys.stderr.write(result.stderr)
+    if result.returncode:
+        raise subprocess.CalledProcessError(result.returncode, command, stderr=result.stderr)
+    return True
+
+
+def deepen(target_dir, commit_date):
+    # --shallow-since отсекает родителей первых коммитов после даты; ещё один уровень нужен,
+    # чтобы их файлы считались изменениями, а не целым деревом корневого коммита
+    if run_shallow(['git', '-C', target_dir, 'fetch', '--quiet', f'--shallow-since={shallow_since(commit_date)}',
+                    'origin']):
+        subprocess.run(['git', '-C', target_dir, 'fetch', '--quiet', '--deepen=1', 'origin'], check=True)
+
+
+def clone_repository(repo_url, target_dir, commit_date=None):
+    """Возвращает каталог репозитория: локальный путь как есть, иначе голый клон без содержимого файлов."""
+    if os.path.isdir(repo_url):
+        return repo_url
+    try:
+        if os.path.isdir(os.path.join(target_dir, '.git')):
+            # Рабочая копия от прежних версий
+            subprocess.run(['git', '-C', target_dir, 'pull', '--ff-only', '--quiet'], check=True)
+        elif os.path.isfile(os.path.join(target_dir, 'HEAD')):
+            subprocess.run(['git', '-C', target_dir, 'fetch', '--quiet', '--prune', 'origin'], check=True)
+            if commit_date and needs_deepen(target_dir, commit_date):
+                deepen(target_dir, commit_date)
+        else:
+            # Для графа нужны только коммиты и деревья: блобы не скачиваются, история обрезается по дате
+            clone = ['git', 'clone', '--quiet', '--bare', '--no-single-branch', '--filter=blob:none']
+            if not commit_date:
+                subprocess.run([*clone, repo_url, target_dir], check=True)
+            else:
+                # Нет коммитов после даты - достаточно вершин веток, граф всё равно будет пустым
+                since = run_shallow([*clone, f'--shallow-since={shallow_since(commit_date)}', repo_url, target_dir],
+                                    [*clone, '--depth=1', repo_url, target_dir])
+            subprocess.run(['git', '-C', target_dir, 'config', 'remote.origin.fetch', '+refs/heads/*:refs/heads/*'],
+                           check=True)
+            if commit_date and since:
+                subprocess.run(['git', '-C', target_dir, 'fetch', '--quiet', '--deepen=1', 'origin'], check=True)
     except subprocess.CalledProcessError as e:
         print(f"Ошибка при клонировании репозитория: {e}")
         exit()
+    return target_dir
+
+
+LOG_FORMAT = '--pretty=format:%x1e%H%x00%cd%x00%an%x00%P%x00'
+
 
+def parse_log(stream, chunk_size=1 << 16):
+    # Поля и имена файлов разделены NUL, запись коммита начинается с \x1e сразу после пустого поля.
+    # Запись: (хеш, дата, автор, файлы, хеши родителей)
+    fields = None
+    files = []
+    previous = ""
+    tail = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        tokens = (tail + chunk).split(b"\0")
+        tail = tokens.pop() if chunk else b""
+        for token in tokens:
+            token = token.decode("utf-8", "replace")
+            if token.startswith("\x1e") and previous == "":
+                if fields:
+                    yield (*fields[:3], files, tuple(fields[3].split()))
+                fields = [token[1:]]
+                files = []
+            elif fields is not None and len(fields) < 4:
+                fields.append(token)
+            elif token:
+                files.append(token.lstrip("\n"))
+            previous = token
+        if not chunk:
+            break
+    if fields:
+        yield (*fields[:3], files, tuple(fields[3].split()))
 
-def get_commits(repo_dir, commit_date):
+
+def get_commits(repo_dir, commit_date, revisions=()):
     os.chdir(repo_dir)
+    process = subprocess.Popen(
+        ['git', 'log', '--after={}'.format(commit_date), LOG_FORMAT, '--date=iso', '--name-only', '--no-renames',
+         '--cc', '-z', *revisions],
+        stdout=subprocess.PIPE
+    )
+    with process:
+        yield from parse_log(process.stdout)
+    if process.returncode:
+        print(f"Ошибка при получении коммитов: git log завершился с кодом {process.returncode}")
+
+
+def get_branch_tips():
+    refs = subprocess.check_output(
+        ['git', 'for-each-ref', '--format=%(objectname) %(refname:short)', 'refs/heads'],
+        text=True
+    ).strip().split('\n')
+    return dict(reversed(ref.split(' ', 1)) for ref in refs if ref)
+
+
+def get_commit_branches():
+    # Один проход rev-list по всем веткам: в --topo-order потомки идут раньше предков,
+    # поэтому маска веток коммита готова к моменту, когда её нужно передать родителям
     try:
-        commits = subprocess.check_output(
-            ['git', 'log', '--after={}'.format(commit_date), '--pretty=format:%H,%cd,%an', '--date=iso'],
-            text=True
-        ).strip().split('\n')
-    except subprocess.CalledProcessError as e:
-        print(f"Ошибка при получении коммитов: {e}")
-        return []
-    commit_info = []
-    for commit in commits:
-        if not commit:
-            return False
-        commit_hash, commit_time, author = commit.split(',')
-        files = subprocess.check_output(['git', 'show', '--name-only', '--pretty=format:', commit_hash],
-                                        text=True).strip().split('\n')
-        commit_info.append((commit_hash, commit_time, author, files))
-    return commit_info
-
-
-def get_commit_branch(commit_hash):
-    try:
-        branch = subprocess.check_output(
-            ['git', 'branch', '--contains', commit_hash],
-            text=True
-        ).strip().split('\n')
-        branch_names = [b.strip('* ') for b in branch]
-        return branch_names
+        tips = get_branch_tips()
     except subprocess.CalledProcessError as e:
-        print(f"Ошибка при определении ветки для коммита {commit_hash}: {e}")
-        return []
+        print(f"Ошибка при получении веток: {e}")
+        return {}
+    if not tips:
+        return {}
+    branch_names = list(tips)
+    masks = {}
+    for i, commit_hash in enumerate(tips.values()):
+        masks[commit_hash] = masks.get(commit_hash, 0) | 1 << i
+
+    process = subprocess.Popen(['git', 'rev-list', '--parents', '--topo-order', *set(tips.values())],
+                               stdout=subprocess.PIPE, text=True)
+    with process:
+        for line in process.stdout:
+            commit_hash, *parents = line.split()
+            mask = masks.get(commit_hash, 0)
+            for parent in parents:
+                masks[parent] = masks.get(parent, 0) | mask
+    if process.returncode:
+        print(f"Ошибка при определении веток: git rev-list завершился с кодом {process.returncode}")
+        return {}
+
+    names = {}
+    commit_branches = {}
+    for commit_hash, mask in masks.items():
+        if mask not in names:
+            names[mask] = [branch for i, branch in enumerate(branch_names) if mask >> i & 1]
+        commit_branches[commit_hash] = names[mask]
+    return commit_branches
+
+
+def rev_parse(revision):
+    return subprocess.check_output(['git', 'rev-parse', '--verify', '--quiet', revision], text=True).strip()
+
+
+def rev_list(*revisions):
+    return subprocess.check_output(['git', 'rev-list', *revisions], text=True).split()
+
+
+def is_ancestor(commit_hash, descendant):
+    return subprocess.run(['git', 'merge-base', '--is-ancestor', commit_hash, descendant],
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+class GitCli:
+    """Те же операции, что у git_objects.Repository, но через вызовы git в текущем каталоге."""
+
+    def head(self):
+        return rev_parse('HEAD')
 
+    def branch_tips(self):
+        return get_branch_tips()
 
-def build_branch_file_graph(commits):
-    G = nx.DiGraph()
-    branch_nodes = {}
+    def commits(self, commit_date, revisions=()):
+        return get_commits('.', commit_date, revisions)
 
-    for commit_hash, commit_time, author, files in commits:
-        branches = get_commit_branch(commit_hash)
-        for branch in branches:
-            if branch not in branch_nodes:
-                branch_nodes[branch] = f"branch_{branch}"
-                G.add_node(branch_nodes[branch], label=f"Ветка: {branch}")
+    def commit_branches(self):
+        return get_commit_branches()
 
-            commit_node = f"commit_{commit_hash}"
-            label = f"{commit_time}\n{author}"
-            G.add_node(commit_node, label=label)
-            G.add_edge(branch_nodes[branch], commit_node)
+    def rev_list(self, *revisions):
+        return rev_list(*revisions)
 
-            for file in files:
-                file_node = f"file_{file}"
-                if file_node not in G:
-                    G.add_node(file_node, label=f"File: {file}")
-                G.add_edge(commit_node, file_node)
+    def is_ancestor(self, commit_hash, descendant):
+        return is_ancestor(commit_hash, descendant)
+
+
+def update_commit_branches(commit_branches, known, old_tips, new_tips, backend=None):
+    backend = backend or GitCli()
+    # Переписываем только ветки, чья вершина сдвинулась: при перемотке вперёд добавляются
+    # новые коммиты ветки, при удалении или force-push ветка пересчитывается целиком
+    members = {commit_hash: set(branches) for commit_hash, branches in commit_branches.items()}
+    for branch in set(old_tips) | set(new_tips):
+        old, new = old_tips.get(branch), new_tips.get(branch)
+        if old == new:
+            continue
+        if old is not None and (new is None or not backend.is_ancestor(old, new)):
+            for branches in members.values():
+                branches.discard(branch)
+            old = None
+        if new is None:
+            continue
+        for commit_hash in backend.rev_list(new, *(['--not', old] if old else [])):
+            if commit_hash in known:
+                members.setdefault(commit_hash, set()).add(branch)
+    return {commit_hash: sorted(branches) for commit_hash, branches in members.items() if branches}
+
+
+def load_commits(repo_dir, commit_date, cache, backend=None):
+    os.chdir(repo_dir)
+    backend = backend or GitCli()
+    head = backend.head()
+    tips = backend.branch_tips()
+    cached = cache.load()
+    if cached is None or not backend.is_ancestor(cached['head'], head):
+        with profiling.stage('commits'):
+            commits = list(backend.commits(commit_date))
+            profiling.count('commits', len(commits))
+        with profiling.stage('branches'):
+            known = {commit[0] for commit in commits}
+            commit_branches = {commit_hash: branches for commit_hash, branches in backend.commit_branches().items()
+                               if commit_hash in known}
+    else:
+        commits = cached['commits']
+        commit_branches = cached['branches']
+        if cached['head'] != head:
+            with profiling.stage('commits'):
+                commits = list(backend.commits(commit_date, [head, '--not', cached['head']])) + commits
+                profiling.count('commits', len(commits))
+        if cached['tips'] != tips:
+            with profiling.stage('branches'):
+                known = {commit[0] for commit in commits}
+                commit_branches = update_commit_branches(commit_branches, known, cached['tips'], tips, backend)
+    cache.save(head, tips, commits, commit_branches)
+    return commits, commit_branches
+
+
+def build_branch_file_graph(commits, commit_branches=None):
+    G = GraphStore()
+
+    # Список родителей нужен только для склейки цепочек в Mermaid, в записях без него цепочек нет
+    for commit_hash, commit_time, author, files, *parents in commits:
+        if commit_branches is None:
+            commit_branches = get_commit_branches()
+        branches = commit_branches.get(commit_hash, [])
+        if not branches:
+            continue
+        branch_nodes = [G.add_node(NodeKind.BRANCH, branch) for branch in branches]
+        commit_node = G.add_node(NodeKind.COMMIT, commit_hash, f"{commit_time}\n{author}")
+        if parents:
+            G.parents[commit_hash] = tuple(parents[0])
+        for branch_node in branch_nodes:
+            G.add_edge(branch_node, commit_node)
+        for file in files:
+            G.add_edge(commit_node, G.add_node(NodeKind.FILE, file))
     return G
 
 
-def generate_mermaid_graph(G):
-    lines = ["graph TD"]
-    for node in G.nodes:
-        label = G.nodes[node].get('label', 'No label available').replace('\n', '<br>')
-        lines.append(f"{node}[\"{label}\"]")
-    for edge in G.edges:
-        lines.append(f"{edge[0]} --> {edge[1]}")
-    return "\n".join(lines)
+def generate_mermaid_graph(G, **options):
+    text = io.StringIO()
+    write_mermaid(G, text, **options)
+    return text.getvalue().rstrip("\n")
 
 
-def visualize_graph(G):
-    # Определяем уровень каждого узла
-    for node in G.nodes:
-        if node.startswith("date_"):  # Узел даты
-            G.nodes[node]['subset'] = 0
-        elif node.startswith("branch_"):  # Узел ветки
-            G.nodes[node]['subset'] = 1
-        elif node.startswith("commit_"):  # Узел коммита
-            G.nodes[node]['subset'] = 2
-        elif node.startswith("file_"):  # Узел файла
-            G.nodes[node]['subset'] = 3
+def visualize_graph(G, output=None, top_commits=20):
+    """Без output граф показывается в окне, иначе сохраняется в файл (формат по расширению: .svg, .png)."""
+    from render import draw_graph
 
-    pos = nx.multipartite_layout(G, subset_key="subset")  # Расположение по уровням
+    if not isinstance(G, GraphStore):
+        G = GraphStore.from_networkx(G)
+    if output is None:
+        import matplotlib.pyplot as plt
 
-    # Увеличиваем расстояние между узлами, уменьшаем длину рёбер
-    for key in pos:
-        pos[key][0] *= 1.5  # Увеличиваем расстояние по горизонтали
-        pos[key][1] *= 1.5  # Увеличиваем расстояние по вертикали
+        figure = plt.figure(figsize=(12, 8))
+    else:
+        # Figure без pyplot не требует дисплея и GUI-бэкенда
+        from matplotlib.figure import Figure
 
-    # Рисуем граф с прозрачными рёбрами
-    plt.figure(figsize=(12, 8))
-    nx.draw(G, pos, with_labels=True, labels=nx.get_node_attributes(G, 'label'), node_size=2000,
-            node_color='lightblue', font_size=8, arrowsize=10, edge_color='gray', width=1.5, alpha=0.8)
-    plt.show()
+        figure = Figure(figsize=(12, 8))
+    draw_graph(G, figure.add_subplot(), top_commits)
+    if output is None:
+        plt.show()
+    else:
+        figure.savefig(output, dpi=150)
 
 
 def get_branches(repo_dir):
@@ -128,23 +361,84 @@ def get_branches(repo_dir):
     return branches
 
 
-def main():
-    config_path = 'config_2.ini'
-    visualizer_path, repo_url, commit_date = read_config(config_path)
+def run(args):
+    config = load_config(args.config)
+    visualizer_path, repo_url, commit_date = read_config(config)
+    mermaid_options = read_mermaid_options(config)
+    render_options = read_render_options(config)
+    # Путь из конфигурации тоже считается от исходного каталога, до перехода в репозиторий
+    if args.output:
+        render_options['output'] = args.output
+    elif render_options['output']:
+        render_options['output'] = os.path.abspath(render_options['output'])
     repo_name = repo_url.split('/')[-1].replace('.git', '')
-    clone_repository(repo_url, repo_name)
+    with profiling.stage('clone'):
+        repo_dir = clone_repository(repo_url, repo_name, commit_date)
+
+    try:
+        # Дата проверяется сразу, а не посреди обхода истории
+        since_timestamp(commit_date, repo_dir)
+    except GitObjectError as e:
+        print(f"Ошибка: {e}")
+        return
 
-    commits = get_commits(repo_name, commit_date)
-    if not commits:
+    cache = CommitCache(os.path.abspath(CACHE_DIR), repo_url, commit_date)
+    # Один потоковый git log быстрее обхода деревьев на Python, поэтому чтение .git без git - по запросу
+    backend = GitCli()
+    if args.backend == 'native':
+        try:
+            backend = Repository(os.path.abspath(repo_dir))
+        except GitObjectError:
+            pass
+    commits, commit_branches = load_commits(repo_dir, commit_date, cache, backend)
+    with profiling.stage('graph'):
+        G = build_branch_file_graph(commits, commit_branches)
+        profiling.count('nodes', G.number_of_nodes())
+        profiling.count('edges', G.number_of_edges())
+    if not G.number_of_nodes():
         print("Нет коммитов после указанной даты.")
         return
 
-    G = build_branch_file_graph(commits)
-    mermaid_graph = generate_mermaid_graph(G)
+    if args.mode != "plot":
+        with profiling.stage('mermaid'):
+            write_mermaid(G, sys.stdout, **mermaid_options)
 
-    print(mermaid_graph)
+    if args.mode != "mermaid":
+        with profiling.stage('render'):
+            visualize_graph(G, **render_options)
 
-    visualize_graph(G)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Граф ветка - коммит - файл для коммитов git-репозитория")
+    parser.add_argument("--config", default='config_2.ini', help="путь к ini-файлу с секцией [DATA]")
+    parser.add_argument("--mode", choices=("mermaid", "plot", "both"), default="both",
+                        help="mermaid - только текст графа, plot - только рисунок, both - и то и другое")
+    parser.add_argument("--output", help="сохранить рисунок в файл (.svg, .png) вместо показа в окне")
+    parser.add_argument("--backend", choices=("git", "native"), default="git",
+                        help="git - история через git log, native - чтение .git без запуска git")
+    parser.add_argument("--profile", action="store_true",
+                        help="вывести в stderr таблицу времени, подпроцессов и памяти по этапам")
+    parser.add_argument("--profile-json", help="записать отчёт по этапам в JSON-файл")
+    parser.add_argument("--profile-dir", help="сохранить cProfile каждого этапа в <каталог>/<этап>.prof")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="пик памяти по этапам через tracemalloc (заметно замедляет этапы)")
+    args = parser.parse_args(argv)
+    # Пути считаются от исходного каталога: load_commits переходит в каталог репозитория
+    args.config = os.path.abspath(args.config)
+    args.output = args.output and os.path.abspath(args.output)
+
+    if not (args.profile or args.profile_json or args.profile_dir or args.profile_memory):
+        run(args)
+        return
+    profile_json = args.profile_json and os.path.abspath(args.profile_json)
+    profile_dir = args.profile_dir and os.path.abspath(args.profile_dir)
+    with profiling.Profiler(profile_dir, trace_memory=args.profile_memory) as profiler:
+        run(args)
+    if args.profile or not profile_json:
+        profiler.write_table(sys.stderr)
+    if profile_json:
+        with open(profile_json, 'w') as file:
+            profiler.write_json(file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+from collections import Counter
+
+import numpy as np
+
+from graph_store import GraphStore, NodeKind
+
+
+def _node_line(name, label):
+    return f"{name}[\"{label.replace(chr(10), '<br>')}\"]\n"
+
+
+def write_mermaid(G, out, depth=None, max_files=None, merge_chains=False):
+    """Пишет граф в out построчно, не собирая весь текст в памяти.
+
+    depth - файлы глубже depth уровней сворачиваются в каталог, max_files - не больше стольких
+    файлов/каталогов на коммит (остаток одним узлом), merge_chains - линейная цепочка коммитов
+    (один родитель, один потомок) с одинаковым набором веток выводится одним узлом.
+    """
+    if not isinstance(G, GraphStore):
+        G = GraphStore.from_networkx(G)
+    out.write("graph TD\n")
+    if depth is None and max_files is None and not merge_chains:
+        for node in G.nodes:
+            out.write(_node_line(G.name(node), G.label(node)))
+        for source, target in G.edges():
+            out.write(f"{G.name(source)} --> {G.name(target)}\n")
+        return
+
+    kinds = G.kinds
+    sources, targets = G.edge_arrays()
+    into_commit = kinds[targets] == NodeKind.COMMIT
+    from_commit = kinds[sources] == NodeKind.COMMIT
+
+    # Всё, кроме коммитов и их файлов, выводится как есть
+    for node in np.flatnonzero((kinds != NodeKind.COMMIT) & (kinds != NodeKind.FILE)):
+        out.write(_node_line(G.name(node), G.label(node)))
+    for source, target in zip(sources[~into_commit & ~from_commit], targets[~into_commit & ~from_commit]):
+        out.write(f"{G.name(source)} --> {G.name(target)}\n")
+
+    incoming = [() for _ in range(len(kinds))]
+    order = np.argsort(targets[into_commit], kind='stable')
+    commit_targets, commit_sources = targets[into_commit][order], sources[into_commit][order]
+    bounds = np.flatnonzero(np.diff(commit_targets)) + 1
+    for group_targets, group_sources in zip(np.split(commit_targets, bounds), np.split(commit_sources, bounds)):
+        if len(group_targets):
+            incoming[group_targets[0]] = tuple(group_sources.tolist())
+
+    # Цепочка - линейный участок истории: у более нового коммита единственный родитель - следующий,
+    # у следующего единственный потомок. Слияния и развилки в цепочку не входят
+    child_counts = Counter(parent for parents in G.parents.values() for parent in parents)
+
+    def linked(newer, older):
+        newer_key, older_key = G.keys[newer], G.keys[older]
+        return (G.parents.get(newer_key) == (older_key,) and child_counts[newer_key] <= 1
+                and child_counts[older_key] == 1 and len(G.parents.get(older_key, ())) <= 1)
+
+    declared = set()
+    chain = []
+    for commit in np.flatnonzero(kinds == NodeKind.COMMIT).tolist():
+        if chain and (not merge_chains or incoming[commit] != incoming[chain[0]] or not linked(chain[-1], commit)):
+            _write_commits(G, out, chain, incoming[chain[0]], declared, depth, max_files)
+            chain = []
+        chain.append(commit)
+    if chain:
+        _write_commits(G, out, chain, incoming[chain[0]], declared, depth, max_files)
+
+
+def _write_commits(G, out, chain, parents, declared, depth, max_files):
+    if len(chain) == 1:
+        name, label = G.name(chain[0]), G.label(chain[0])
+    else:
+        name = f"chain_{G.keys[chain[0]]}"
+        label = f"Коммитов: {len(chain)}\n{G.label(chain[0])}\n...\n{G.label(chain[-1])}"
+    out.write(_node_line(name, label))
+    for parent in parents:
+        out.write(f"{G.name(parent)} --> {name}\n")
+
+    children = {}
+    for commit in chain:
+        for child in G.successors(commit).tolist():
+            child_name, child_label = G.name(child), None
+            if depth is not None and G.kind(child) == NodeKind.FILE:
+                parts = G.keys[child].split('/')
+                if len(parts) > depth:
+                    directory = '/'.join(parts[:depth])
+                    child_name, child_label = f"dir_{directory}", f"Dir: {directory}/"
+            # Подпись файла строится, только если узел ещё не объявлен
+            children.setdefault(child_name, child if child_label is None else child_label)
+    shown = list(children.items())
+    if max_files is not None:
+        shown, hidden = shown[:max_files], len(shown) - max_files
+        if hidden > 0:
+            out.write(_node_line(f"more_{name}", f"... ещё {hidden}"))
+            out.write(f"{name} --> more_{name}\n")
+    for child_name, child_label in shown:
+        if child_name not in declared:
+            declared.add(child_name)
+            out.write(_node_line(child_name, G.label(child_label) if isinstance(child_label, int) else child_label))
+        out.write(f"{name} --> {child_name}\n")
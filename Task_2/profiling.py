@@ -0,0 +1,152 @@
+"""Замеры по этапам конвейера: время, число запущенных подпроцессов, память и счётчики.
+
+Пока профилировщик не включён, stage() и count() ничего не делают, так что вызовы можно
+оставлять в коде без потерь. Память по умолчанию - прирост пикового RSS процесса за этап;
+tracemalloc включается отдельно (trace_memory), потому что в разы замедляет Python-код
+и искажает время этапов.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active = None
+
+
+class Stage:
+    __slots__ = ("name", "wall_s", "subprocesses", "rss_growth_kb", "peak_bytes", "counts")
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_s = 0.0
+        self.subprocesses = 0
+        self.rss_growth_kb = None
+        self.peak_bytes = None
+        self.counts = {}
+
+    def as_dict(self):
+        return {"stage": self.name, "wall_s": round(self.wall_s, 6), "subprocesses": self.subprocesses,
+                "rss_growth_kb": self.rss_growth_kb, "peak_bytes": self.peak_bytes, **self.counts}
+
+
+def max_rss_kb():
+    """Пиковый RSS процесса в КБ (на macOS ru_maxrss в байтах), None без модуля resource."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class Profiler:
+    """Включается на время блока with; profile_dir - куда складывать cProfile каждого этапа."""
+
+    def __init__(self, profile_dir=None, trace_memory=False):
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.subprocesses = 0
+        self._current = []
+        self._popen = None
+
+    def __enter__(self):
+        global _active
+        profiler = self
+
+        class CountingPopen(subprocess.Popen):
+            def __init__(self, *args, **kwargs):
+                profiler.subprocesses += 1
+                super().__init__(*args, **kwargs)
+
+        # subprocess.run и check_output создают Popen через глобальное имя модуля
+        self._popen = subprocess.Popen
+        subprocess.Popen = CountingPopen
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = None
+        subprocess.Popen = self._popen
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stage = self.stages.setdefault(name, Stage(name))
+        self._current.append(stage)
+        subprocesses = self.subprocesses
+        rss = max_rss_kb()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile() if self.profile_dir else None
+        start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield stage
+        finally:
+            if profile:
+                profile.disable()
+                profile.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+            stage.wall_s += time.perf_counter() - start
+            stage.subprocesses += self.subprocesses - subprocesses
+            if rss is not None:
+                stage.rss_growth_kb = (stage.rss_growth_kb or 0) + max_rss_kb() - rss
+            if self.trace_memory:
+                stage.peak_bytes = max(stage.peak_bytes or 0, tracemalloc.get_traced_memory()[1])
+            self._current.pop()
+
+    def count(self, name, value):
+        if self._current:
+            self._current[-1].counts[name] = value
+
+    def report(self):
+        return {
+            "stages": [stage.as_dict() for stage in self.stages.values()],
+            "total_s": round(sum(stage.wall_s for stage in self.stages.values()), 6),
+            "subprocesses": self.subprocesses,
+            "max_rss_kb": max_rss_kb(),
+            "memory_tracing": self.trace_memory,
+        }
+
+    def write_json(self, stream):
+        stream.write(json.dumps(self.report(), indent=2) + "\n")
+
+    def write_table(self, stream):
+        report = self.report()
+        stream.write(f"{'этап':<12}{'время, с':>10}{'процессов':>11}{'+RSS, КБ':>10}{'пик, КБ':>10}  счётчики\n")
+        for stage in report["stages"]:
+            counts = ", ".join(f"{key}={value}" for key, value in stage.items()
+                               if key not in ("stage", "wall_s", "subprocesses", "rss_growth_kb", "peak_bytes"))
+            rss = "-" if stage["rss_growth_kb"] is None else stage["rss_growth_kb"]
+            peak = "-" if stage["peak_bytes"] is None else stage["peak_bytes"] // 1024
+            stream.write(f"{stage['stage']:<12}{stage['wall_s']:>10.3f}{stage['subprocesses']:>11}"
+                         f"{rss:>10}{peak:>10}  {counts}\n")
+        stream.write(f"{'итого':<12}{report['total_s']:>10.3f}{report['subprocesses']:>11}\n")
+        if report["memory_tracing"]:
+            stream.write("Память отслеживалась tracemalloc: время этапов завышено\n")
+
+
+def stage(name):
+    """Этап активного профилировщика или пустой контекст, если профилирование выключено."""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+
+def count(name, value):
+    if _active is not None:
+        _active.count(name, value)
@@ -0,0 +1,49 @@
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
+
+from graph_store import NodeKind
+
+COLORS = to_rgba_array(['#f4a261', '#e76f51', '#2a9d8f', '#8ecae6', '#adb5bd'])
+LABEL_ALL = 200
+GRID = 4096
+
+
+def draw_graph(G, ax, top_commits=20):
+    """Рисует граф на оси: все рёбра одной LineCollection, все узлы одним scatter.
+
+    Подписи есть у веток и top_commits коммитов с наибольшим числом файлов;
+    граф до LABEL_ALL узлов подписывается целиком. В большом графе рёбра и узлы в SVG/PDF
+    вставляются растром, подписи остаются векторными.
+    """
+    positions = G.layout()
+    kinds = G.kinds
+    count = len(kinds)
+    sources, targets = G.edge_arrays()
+
+    segments = positions[np.stack([sources, targets], axis=1)]
+    large = count > LABEL_ALL
+    if large:
+        # Рёбра, совпадающие с точностью до ячейки сетки, на картинке неотличимы - рисуем одно
+        low, high = positions.min(axis=0), positions.max(axis=0)
+        cells = np.round((segments - low) / np.maximum(high - low, 1e-9) * (GRID - 1)).astype(np.int64)
+        codes = ((cells[:, 0, 0] * GRID + cells[:, 0, 1]) * GRID + cells[:, 1, 0]) * GRID + cells[:, 1, 1]
+        segments = segments[np.unique(codes, return_index=True)[1]]
+    ax.add_collection(LineCollection(segments, colors='gray', linewidths=0.5 if large else 1.5, alpha=0.4,
+                                     antialiased=not large, rasterized=large, zorder=1))
+    ax.scatter(positions[:, 0], positions[:, 1], s=max(2.0, min(300.0, 60000.0 / max(count, 1))),
+               c=COLORS[np.minimum(kinds, len(COLORS) - 1)], linewidths=0, rasterized=large, zorder=2)
+
+    if count <= LABEL_ALL:
+        labelled = np.arange(count)
+    else:
+        commits = np.flatnonzero(kinds == NodeKind.COMMIT)
+        degree = np.diff(G.csr()[0])[commits]
+        top = commits[np.argsort(-degree, kind='stable')[:top_commits]]
+        labelled = np.concatenate([np.flatnonzero(kinds == NodeKind.BRANCH), np.sort(top)])
+    for node in labelled.tolist():
+        ax.annotate(G.label(node), positions[node], fontsize=8, ha='center', va='center', zorder=3)
+
+    ax.set_axis_off()
+    ax.autoscale_view()
+    ax.margins(0.1)
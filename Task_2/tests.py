@@ -1,6 +1,18 @@
+import configparser
+import io
+import json
+import os
+import tempfile
+import tracemalloc
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
+import networkx as nx
+from matplotlib.figure import Figure
 from main import *  # Импортируем все функции из основного файла
+from render import draw_graph
+import profiling
+from git_objects import apply_delta
+from graph_store import GraphStore, NodeKind
 
 
 class TestGitVisualization(unittest.TestCase):
@@ -19,43 +31,64 @@ class TestGitVisualization(unittest.TestCase):
 
     @patch('subprocess.run')
     def test_clone_repository(self, mock_run):
-        mock_run.return_value = None
+        mock_run.return_value = MagicMock(returncode=0, stderr='')
         repo_url = 'https://mock_repo.git'
         target_dir = 'mock_dir'
-        clone_repository(repo_url, target_dir)
-        mock_run.assert_called_once_with(['git', 'clone', repo_url, target_dir], check=True)
+        self.assertEqual(clone_repository(repo_url, target_dir), target_dir)
+        mock_run.assert_any_call(['git', 'clone', '--quiet', '--bare', '--no-single-branch', '--filter=blob:none',
+                                  repo_url, target_dir], check=True)
+        clone_repository(repo_url, target_dir, '2024-11-23')
+        mock_run.assert_any_call(['git', 'clone', '--quiet', '--bare', '--no-single-branch', '--filter=blob:none',
+                                  '--shallow-since=2024-11-23 00:00', repo_url, target_dir],
+                                 stderr=subprocess.PIPE, text=True)
+        mock_run.assert_called_with(['git', '-C', target_dir, 'fetch', '--quiet', '--deepen=1', 'origin'], check=True)
 
-    @patch('subprocess.check_output')
+    @patch('subprocess.Popen')
     @patch('os.chdir')
-    def test_get_commits(self, mock_chdir, mock_check_output):
-        mock_check_output.return_value = 'mock_commit_hash,2024-01-01,Author\nmock_commit_hash_2,2024-01-02,Author2'
+    def test_get_commits(self, mock_chdir, mock_popen):
+        mock_popen.return_value.stdout = io.BytesIO(
+            b'\x1emock_commit_hash\x002024-01-01\x00Author\x00mock_commit_hash_2\x00\nfile1\x00dir/file 2\x00\x00'
+            b'\x1emock_commit_hash_2\x002024-01-02\x00Author2\x00\x00\x00\x00')
+        mock_popen.return_value.returncode = 0
         repo_dir = 'mock_repo'
         commit_date = '2024-01-01'
-        commits = get_commits(repo_dir, commit_date)
+        commits = list(get_commits(repo_dir, commit_date))
         mock_chdir.assert_called_once_with(repo_dir)
-        mock_check_output.assert_any_call(
-            ['git', 'log', '--after=2024-01-01', '--pretty=format:%H,%cd,%an', '--date=iso'], text=True)
+        mock_popen.assert_called_once_with(
+            ['git', 'log', '--after=2024-01-01', LOG_FORMAT, '--date=iso', '--name-only', '--no-renames', '--cc',
+             '-z'],
+            stdout=subprocess.PIPE)
         self.assertEqual(len(commits), 2)
-        self.assertEqual(commits[0][0], 'mock_commit_hash')
+        self.assertEqual(commits[0], ('mock_commit_hash', '2024-01-01', 'Author', ['file1', 'dir/file 2'],
+                                      ('mock_commit_hash_2',)))
+        self.assertEqual(commits[1][3:], ([], ()))
 
-    @patch('subprocess.check_output')
-    def test_get_commit_branch(self, mock_check_output):
-        mock_check_output.return_value = '* main\n  dev'
-        commit_hash = 'mock_commit_hash'
-        branches = get_commit_branch(commit_hash)
-        self.assertIn('main', branches)
-        self.assertIn('dev', branches)
+    def test_parse_log_comma_in_author(self):
+        stream = io.BytesIO(b'\x1eabc\x002024-01-01 10:00:00 +0300\x00Doe, John\x00p1 p2\x00\na,b.txt\x00\x00')
+        commits = list(parse_log(stream, chunk_size=3))
+        self.assertEqual(commits, [('abc', '2024-01-01 10:00:00 +0300', 'Doe, John', ['a,b.txt'], ('p1', 'p2'))])
 
+    @patch('subprocess.Popen')
     @patch('subprocess.check_output')
-    def test_build_branch_file_graph(self, mock_check_output):
-        mock_check_output.return_value = 'mock_parent_hash'
+    def test_get_commit_branches(self, mock_check_output, mock_popen):
+        mock_check_output.return_value = 'c3 main\nc4 dev'
+        # c4 (dev) -> c2 -> c1, c3 (main) -> c2
+        mock_popen.return_value.stdout = io.StringIO('c4 c2\nc3 c2\nc2 c1\nc1\n')
+        mock_popen.return_value.returncode = 0
+        branches = get_commit_branches()
+        self.assertEqual(branches['c3'], ['main'])
+        self.assertEqual(branches['c4'], ['dev'])
+        self.assertEqual(branches['c2'], ['main', 'dev'])
+        self.assertEqual(branches['c1'], ['main', 'dev'])
+        self.assertEqual(mock_popen.call_count, 1)
+
+    def test_build_branch_file_graph(self):
         commits = [
             ('mock_commit_hash', '2024-01-01', 'Author', ['file1', 'file2']),
             ('mock_commit_hash_2', '2024-01-02', 'Author2', ['file3'])]
-        # Подготавливаем mock для веток
-        with patch('main.get_commit_branch', return_value=['main', 'dev']):
-            G = build_branch_file_graph(commits)
-        self.assertEqual(len(G.nodes), 5)  # 2 коммита + 3 файла
+        commit_branches = {'mock_commit_hash': ['main', 'dev'], 'mock_commit_hash_2': ['main', 'dev']}
+        G = build_branch_file_graph(commits, commit_branches)
+        self.assertEqual(len(G.nodes), 7)  # 2 ветки + 2 коммита + 3 файла
         self.assertTrue(G.has_node('branch_main'))
         self.assertTrue(G.has_node('branch_dev'))
         self.assertTrue(G.has_edge('branch_main', 'commit_mock_commit_hash'))
@@ -79,6 +112,47 @@ class TestGitVisualization(unittest.TestCase):
         self.assertIn("A[\"Commit A\"]", mermaid_graph)
         self.assertIn("A --> B", mermaid_graph)
 
+    def test_write_mermaid_aggregation(self):
+        commits = [('c3', 'd3', 'A', ['src/a/x.py', 'src/b/y.py', 'top.txt'], ('c2',)),
+                   ('c2', 'd2', 'A', ['src/a/z.py'], ('c1',)),
+                   ('c1', 'd1', 'B', ['docs/r.md'], ())]
+        G = build_branch_file_graph(commits, {'c3': ['main'], 'c2': ['main'], 'c1': ['main', 'dev']})
+        out = io.StringIO()
+        write_mermaid(G, out, depth=1, max_files=1, merge_chains=True)
+        lines = out.getvalue().splitlines()
+        self.assertIn('branch_main --> chain_c3', lines)
+        self.assertIn('chain_c3 --> dir_src', lines)
+        self.assertIn('more_chain_c3["... ещё 1"]', lines)
+        self.assertIn('commit_c1 --> dir_docs', lines)
+        self.assertNotIn('commit_c2', out.getvalue())
+        self.assertEqual(sum(line.startswith('dir_src[') for line in lines), 1)
+
+    def test_merge_chains_stops_at_merges(self):
+        # c4 - слияние c3 и c2, которые растут из c1: цепочкой сворачиваются только c6 и c5
+        commits = [('c6', 'd', 'A', ['f'], ('c5',)), ('c5', 'd', 'A', ['f'], ('c4',)),
+                   ('c4', 'd', 'A', ['f'], ('c3', 'c2')), ('c3', 'd', 'A', ['f'], ('c1',)),
+                   ('c2', 'd', 'A', ['f'], ('c1',)), ('c1', 'd', 'A', ['f'], ())]
+        G = build_branch_file_graph(commits, {sha: ['main'] for sha, *_ in commits})
+        out = io.StringIO()
+        write_mermaid(G, out, merge_chains=True)
+        text = out.getvalue()
+        self.assertIn('chain_c6["Коммитов: 2', text)
+        for sha in ('c4', 'c3', 'c2', 'c1'):
+            self.assertIn(f'branch_main --> commit_{sha}', text)
+
+    @patch('main.visualize_graph')
+    @patch('main.load_commits', return_value=([('c1', '2024-01-01', 'Author', ['f'])], {'c1': ['main']}))
+    @patch('main.clone_repository', return_value='repo')
+    @patch('main.read_config', return_value=('main.py', 'https://mock/repo.git', '2024-01-01'))
+    def test_main_mermaid_mode(self, mock_config, mock_clone, mock_load, mock_visualize):
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main(['--config', 'missing.ini', '--mode', 'mermaid'])
+        mock_config.assert_called_once()
+        self.assertIsInstance(mock_config.call_args.args[0], configparser.ConfigParser)
+        mock_clone.assert_called_once_with('https://mock/repo.git', 'repo', '2024-01-01')
+        self.assertIn('branch_main --> commit_c1', stdout.getvalue())
+        mock_visualize.assert_not_called()
+
     @patch('matplotlib.pyplot.show')
     def test_visualize_graph(self, mock_show):
         G = nx.DiGraph()
@@ -88,6 +162,346 @@ class TestGitVisualization(unittest.TestCase):
         visualize_graph(G)
         mock_show.assert_called_once()
 
+    @patch('matplotlib.pyplot.show')
+    def test_visualize_graph_to_file(self, mock_show):
+        commits = [(f'c{i}', '2024-01-01', 'Author', [f'dir/f{i % 300}', f'f{i}']) for i in range(400)]
+        G = build_branch_file_graph(commits, {f'c{i}': ['main'] for i in range(400)})
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('graph.svg', 'graph.png'):
+                path = os.path.join(tmp, name)
+                visualize_graph(G, path, top_commits=5)
+                self.assertGreater(os.path.getsize(path), 0)
+        mock_show.assert_not_called()
+        # Подписаны только ветка и пять коммитов
+        ax = Figure().add_subplot()
+        draw_graph(G, ax, top_commits=5)
+        self.assertEqual(len(ax.texts), 6)
+
+
+class TestGraphStore(unittest.TestCase):
+    def test_interned_nodes_and_csr_edges(self):
+        store = GraphStore()
+        branch = store.add_node(NodeKind.BRANCH, 'main')
+        commit = store.add_node(NodeKind.COMMIT, 'abc', '2024-01-01\nAuthor')
+        file = store.add_node(NodeKind.FILE, 'a.txt')
+        self.assertEqual(store.add_node(NodeKind.FILE, 'a.txt'), file)
+        store.add_edge(commit, file)
+        store.add_edge(branch, commit)
+        store.add_edge(commit, file)
+        indptr, indices = store.csr()
+        self.assertEqual(indptr.tolist(), [0, 1, 2, 2])
+        self.assertEqual(indices.tolist(), [commit, file])
+        self.assertEqual(store.kinds.tolist(), [NodeKind.BRANCH, NodeKind.COMMIT, NodeKind.FILE])
+        self.assertEqual(store.label(file), 'File: a.txt')
+        self.assertTrue(store.has_edge('commit_abc', 'file_a.txt'))
+        self.assertFalse(store.has_edge('file_a.txt', 'commit_abc'))
+
+    def test_networkx_round_trip(self):
+        store = build_branch_file_graph([('abc', '2024-01-01', 'Author', ['f'])], {'abc': ['main']})
+        G = store.to_networkx()
+        self.assertEqual(sorted(G.edges), [('branch_main', 'commit_abc'), ('commit_abc', 'file_f')])
+        self.assertEqual(G.nodes['commit_abc']['label'], '2024-01-01\nAuthor')
+        self.assertEqual(generate_mermaid_graph(GraphStore.from_networkx(G)), generate_mermaid_graph(store))
+
+
+def git(repo_dir, *args):
+    subprocess.run(['git', '-C', repo_dir, *args], check=True, capture_output=True)
+
+
+def commit_file(repo_dir, name, text, date='2024-12-01T12:00:00'):
+    with open(os.path.join(repo_dir, name), 'a') as file:
+        file.write(text)
+    git(repo_dir, 'add', name)
+    subprocess.run(['git', '-C', repo_dir, '-c', 'user.name=Test, User', '-c', 'user.email=t@example.com',
+                    'commit', '-q', '-m', name], check=True, capture_output=True,
+                   env=dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date))
+
+
+class TestCommitCache(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = os.path.join(self.tmp.name, 'repo')
+        os.mkdir(self.repo)
+        git(self.repo, 'init', '-q', '-b', 'main')
+        commit_file(self.repo, 'a.txt', 'a')
+        commit_file(self.repo, 'b.txt', 'b')
+        self.cache = CommitCache(os.path.join(self.tmp.name, 'cache'), self.repo, '2024-11-23')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_incremental_update_matches_full_run(self):
+        load_commits(self.repo, '2024-11-23', self.cache)
+        os.chdir(self.cwd)
+        git(self.repo, 'checkout', '-q', '-b', 'dev')
+        commit_file(self.repo, 'c.txt', 'c')
+        git(self.repo, 'checkout', '-q', 'main')
+        commit_file(self.repo, 'a.txt', 'a2')
+
+        with patch('main.get_commit_branches') as full_scan:
+            commits, branches = load_commits(self.repo, '2024-11-23', self.cache)
+        full_scan.assert_not_called()
+        os.chdir(self.cwd)
+        self.cache.invalidate()
+        expected_commits, expected_branches = load_commits(self.repo, '2024-11-23', self.cache)
+        self.assertEqual(commits, expected_commits)
+        self.assertEqual(branches, expected_branches)
+        self.assertEqual(len(commits), 3)
+
+
+class TestRepository(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = os.path.join(self.tmp.name, 'repo')
+        os.makedirs(os.path.join(self.repo, 'src', 'deep'))
+        git(self.repo, 'init', '-q', '-b', 'main')
+        text = ''.join(f'line {i}\n' for i in range(2000))
+        commit_file(self.repo, 'src/deep/big.txt', text, '2024-12-01T10:00:00')
+        commit_file(self.repo, 'readme.md', 'readme', '2024-12-01T11:00:00')
+        git(self.repo, 'checkout', '-q', '-b', 'dev')
+        commit_file(self.repo, 'src/deep/big.txt', 'tail\n', '2024-12-02T10:00:00')
+        git(self.repo, 'mv', 'readme.md', 'src/readme.md')
+        commit_file(self.repo, 'src/new.txt', 'new', '2024-12-02T11:00:00')
+        git(self.repo, 'checkout', '-q', 'main')
+        commit_file(self.repo, 'other.txt', 'other', '2024-12-03T10:00:00')
+        subprocess.run(['git', '-C', self.repo, '-c', 'user.name=Merger', '-c', 'user.email=m@example.com',
+                        'merge', '-q', '--no-ff', '-m', 'merge', 'dev'], check=True, capture_output=True,
+                       env=dict(os.environ, GIT_AUTHOR_DATE='2024-12-04T10:00:00',
+                                GIT_COMMITTER_DATE='2024-12-04T10:00:00'))
+        git(self.repo, '-c', 'user.name=Tagger', '-c', 'user.email=t@example.com', 'tag', '-a', '-m', 'release', 'v1',
+            'dev')
+        os.chdir(self.repo)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def assert_matches_cli(self, path=None):
+        repository = Repository(path or self.repo)
+        cli = GitCli()
+        self.assertEqual(repository.head(), cli.head())
+        self.assertEqual(repository.branch_tips(), cli.branch_tips())
+        self.assertEqual(repository.resolve('v1'), rev_parse('v1^{commit}'))
+        self.assertEqual(list(repository.commits('2024-11-23 00:00')), list(cli.commits('2024-11-23 00:00')))
+        self.assertEqual(list(repository.commits('2024-12-02 12:00')), list(cli.commits('2024-12-02 12:00')))
+        self.assertEqual(repository.commit_branches(), cli.commit_branches())
+        self.assertEqual(list(repository.rev_list('main', '--not', 'dev')), cli.rev_list('main', '--not', 'dev'))
+        self.assertTrue(repository.is_ancestor('dev', 'main'))
+        self.assertFalse(repository.is_ancestor('main', 'dev'))
+
+    def test_loose_objects(self):
+        self.assert_matches_cli()
+
+    def test_packed_objects_and_refs(self):
+        git(self.repo, 'gc', '-q', '--aggressive')
+        self.assertFalse(os.path.exists(os.path.join(self.repo, '.git', 'refs', 'heads', 'main')))
+        self.assert_matches_cli()
+        # Одна из версий big.txt хранится дельтой от другой
+        repository = Repository(self.repo)
+        for revision in ('main:src/deep/big.txt', 'main~1:src/deep/big.txt'):
+            blob = rev_parse(revision)
+            expected = subprocess.check_output(['git', 'cat-file', 'blob', blob])
+            self.assertEqual(repository.read_object(blob), ('blob', expected))
+
+    def test_worktree_uses_common_dir(self):
+        worktree = os.path.join(self.tmp.name, 'worktree')
+        git(self.repo, 'worktree', 'add', '-q', '-b', 'side', worktree, 'dev')
+        commit_file(worktree, 'side.txt', 'side', '2024-12-05T10:00:00')
+        git(self.repo, 'pack-refs', '--all')
+        os.chdir(worktree)
+        self.assert_matches_cli(worktree)
+        self.assertEqual(Repository(worktree).head(), rev_parse('side'))
+
+    def test_mode_change_and_equal_timestamps(self):
+        git(self.repo, 'update-index', '--chmod=+x', 'other.txt')
+        subprocess.run(['git', '-C', self.repo, '-c', 'user.name=Test', '-c', 'user.email=t@example.com',
+                        'commit', '-q', '-m', 'chmod'], check=True, capture_output=True,
+                       env=dict(os.environ, GIT_AUTHOR_DATE='2024-12-05T10:00:00',
+                                GIT_COMMITTER_DATE='2024-12-05T10:00:00'))
+        # Две ветки с одинаковым временем коммитов: порядок вывода задаёт очередь, а не хеши
+        git(self.repo, 'checkout', '-q', '-b', 'left')
+        for i in range(4):
+            commit_file(self.repo, f'l{i}.txt', 'l', '2024-12-06T10:00:00')
+        git(self.repo, 'checkout', '-q', '-b', 'right', 'main')
+        for i in range(4):
+            commit_file(self.repo, f'r{i}.txt', 'r', '2024-12-06T10:00:00')
+        subprocess.run(['git', '-C', self.repo, '-c', 'user.name=Merger', '-c', 'user.email=m@example.com',
+                        'merge', '-q', '--no-ff', '-m', 'merge', 'left'], check=True, capture_output=True,
+                       env=dict(os.environ, GIT_AUTHOR_DATE='2024-12-06T10:00:00',
+                                GIT_COMMITTER_DATE='2024-12-06T10:00:00'))
+        commits = list(Repository(self.repo).commits('2024-11-23 00:00'))
+        self.assertEqual(commits, list(GitCli().commits('2024-11-23 00:00')))
+        self.assertIn(['other.txt'], [commit[3] for commit in commits])
+
+    def test_dates_in_git_formats(self):
+        repository = Repository(self.repo)
+        for date in ('02.12.2024', '2024-12-02T12:00:00', '2 weeks ago'):
+            self.assertEqual(list(repository.commits(date)), list(GitCli().commits(date)))
+        with self.assertRaises(GitObjectError):
+            since_timestamp('02.12.2024', self.tmp.name)
+
+    def test_apply_delta(self):
+        # Копия 5 байт с начала базы, затем вставка литерала
+        delta = bytes([11, 8, 0x90, 5, 3]) + b'xyz'
+        self.assertEqual(apply_delta(b'hello world', delta), b'helloxyz')
+
+
+class TestCloneRepository(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'source')
+        os.mkdir(self.source)
+        git(self.source, 'init', '-q', '-b', 'main')
+        git(self.source, 'config', 'uploadpack.allowFilter', 'true')
+        commit_file(self.source, 'old.txt', 'old', '2024-11-01T12:00:00')
+        commit_file(self.source, 'edge.txt', 'edge', '2024-11-20T12:00:00')
+        commit_file(self.source, 'a.txt', 'a', '2024-11-25T12:00:00')
+        git(self.source, 'checkout', '-q', '-b', 'dev')
+        commit_file(self.source, 'b.txt', 'b', '2024-11-26T12:00:00')
+        git(self.source, 'checkout', '-q', 'main')
+        self.url = 'file://' + self.source
+        self.target = os.path.join(self.tmp.name, 'clone')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def commits(self, repo_dir):
+        repository = Repository(repo_dir)
+        return list(repository.commits('2024-11-23 00:00', ['main', 'dev'])), repository.commit_branches()
+
+    def test_local_path_is_used_in_place(self):
+        with patch('subprocess.run') as mock_run:
+            self.assertEqual(clone_repository(self.source, self.target, '2024-11-23'), self.source)
+        mock_run.assert_not_called()
+
+    def test_shallow_partial_clone_and_fetch(self):
+        self.assertEqual(clone_repository(self.url, self.target, '2024-11-23'), self.target)
+        self.assertFalse(os.path.exists(os.path.join(self.target, 'old.txt')))
+        # Самый старый коммит за границей клона, содержимое файлов не скачано
+        objects = subprocess.check_output(['git', '-C', self.target, 'rev-list', '--objects', '--missing=print',
+                                           '--all'], text=True).split('\n')
+        self.assertNotIn(rev_parse_in(self.source, 'main~2'), {line.split(' ')[0] for line in objects})
+        self.assertEqual(sum(line.startswith('?') for line in objects), 4)
+        commits, branches = self.commits(self.target)
+        self.assertEqual([commit[3] for commit in commits], [['b.txt'], ['a.txt']])
+        self.assertEqual((commits, {sha: branches[sha] for sha, *_ in commits}),
+                         (self.commits(self.source)[0], {sha: self.commits(self.source)[1][sha] for sha, *_ in commits}))
+
+        commit_file(self.source, 'c.txt', 'c', '2024-11-27T12:00:00')
+        clone_repository(self.url, self.target, '2024-11-23')
+        self.assertEqual(Repository(self.target).branch_tips(), Repository(self.source).branch_tips())
+        self.assertEqual(self.commits(self.target)[0], self.commits(self.source)[0])
+
+        # Более ранняя дата требует догрузить историю
+        clone_repository(self.url, self.target, '2024-11-15')
+        self.assertEqual(list(Repository(self.target).commits('2024-11-15 00:00')),
+                         list(Repository(self.source).commits('2024-11-15 00:00')))
+
+
+    def test_no_commits_after_date(self):
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self.assertEqual(clone_repository(self.url, self.target, '2030-01-01'), self.target)
+            self.assertEqual(list(Repository(self.target).commits('2030-01-01')), [])
+            self.assertEqual(Repository(self.target).branch_tips(), Repository(self.source).branch_tips())
+            deepen(self.target, '2030-01-01')
+        self.assertNotIn('no commits selected', stderr.getvalue())
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = os.path.join(self.tmp.name, 'repo')
+        os.mkdir(self.repo)
+        git(self.repo, 'init', '-q', '-b', 'main')
+        commit_file(self.repo, 'a.txt', 'a')
+        commit_file(self.repo, 'b.txt', 'b')
+        self.config = os.path.join(self.tmp.name, 'config.ini')
+        with open(self.config, 'w') as file:
+            file.write(f'[DATA]\nvisualizer_path = main.py\nrepo_path = {self.repo}\ncommit_date = 2024-11-23\n')
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_stage_report(self):
+        with patch('sys.stdout', new_callable=io.StringIO), patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            main(['--config', self.config, '--mode', 'mermaid', '--backend', 'native', '--profile',
+                  '--profile-json', 'report.json', '--profile-dir', 'profiles'])
+        os.chdir(self.tmp.name)
+        with open('report.json') as file:
+            report = json.load(file)
+        stages = {stage['stage']: stage for stage in report['stages']}
+        self.assertEqual(list(stages), ['clone', 'commits', 'branches', 'graph', 'mermaid'])
+        self.assertEqual(stages['commits']['commits'], 2)
+        self.assertEqual((stages['graph']['nodes'], stages['graph']['edges']), (5, 4))
+        self.assertEqual(stages['commits']['subprocesses'], 0)
+        self.assertFalse(report['memory_tracing'])
+        self.assertIsNone(stages['graph']['peak_bytes'])
+        self.assertGreaterEqual(stages['graph']['rss_growth_kb'], 0)
+        self.assertIn('mermaid', stderr.getvalue())
+        self.assertNotIn('tracemalloc', stderr.getvalue())
+        self.assertTrue(os.path.exists(os.path.join('profiles', 'graph.prof')))
+        self.assertIs(subprocess.Popen, profiling_popen)
+
+    def test_memory_tracing_is_opt_in(self):
+        with patch('sys.stdout', new_callable=io.StringIO), patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            main(['--config', self.config, '--mode', 'mermaid', '--profile-memory'])
+        self.assertIn('tracemalloc', stderr.getvalue())
+        self.assertFalse(tracemalloc.is_tracing())
+        with profiling.Profiler(trace_memory=True) as profiler, profiling.stage('graph'):
+            [object() for _ in range(1000)]
+        self.assertGreater(profiler.stages['graph'].peak_bytes, 0)
+
+    def test_git_log_is_default_backend(self):
+        with patch('main.load_commits', return_value=([], {})) as load, patch('sys.stdout', new_callable=io.StringIO):
+            main(['--config', self.config, '--mode', 'mermaid'])
+            self.assertIsInstance(load.call_args.args[3], GitCli)
+            main(['--config', self.config, '--mode', 'mermaid', '--backend', 'native'])
+            self.assertIsInstance(load.call_args.args[3], Repository)
+
+    def test_relative_config_path(self):
+        with open(self.config, 'a') as file:
+            file.write('[MERMAID]\nmerge_chains = true\n')
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main(['--config', 'config.ini', '--mode', 'mermaid'])
+        self.assertIn('branch_main --> chain_', stdout.getvalue())
+
+    @patch('main.visualize_graph')
+    def test_relative_output_path(self, mock_visualize):
+        with patch('sys.stdout', new_callable=io.StringIO):
+            main(['--config', self.config, '--mode', 'plot', '--output', 'graph.png'])
+        self.assertEqual(mock_visualize.call_args.kwargs['output'], os.path.join(self.tmp.name, 'graph.png'))
+
+    @patch('main.visualize_graph')
+    def test_render_options_from_relative_config(self, mock_visualize):
+        with open(self.config, 'a') as file:
+            file.write('[RENDER]\noutput = out/graph.svg\ntop_commits = 3\n')
+        with patch('configparser.ConfigParser.read', autospec=True,
+                   side_effect=configparser.ConfigParser.read) as read:
+            main(['--config', 'config.ini', '--mode', 'plot'])
+        read.assert_called_once()
+        mock_visualize.assert_called_once_with(ANY, output=os.path.join(self.tmp.name, 'out', 'graph.svg'),
+                                               top_commits=3)
+
+    def test_disabled_stage_is_noop(self):
+        with profiling.stage('graph'):
+            profiling.count('nodes', 1)
+        self.assertIsNone(profiling._active)
+
+
+profiling_popen = subprocess.Popen
+
+
+def rev_parse_in(repo_dir, revision):
+    return subprocess.check_output(['git', '-C', repo_dir, 'rev-parse', revision], text=True).strip()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+from dz3 import PARSER_VERSION, ConfigParser
+
+CACHE_VERSION = 1
+
+
+class ConfigCache:
+    """Результаты разбора по хешу текста: LRU в памяти процесса и, если задан cache_dir, файлы на диске.
+
+    Хранятся сериализованные данные, поэтому каждый вызов получает свою копию словаря
+    и изменения у вызывающего не портят кэш.
+    """
+
+    def __init__(self, cache_dir=None, maxsize=128):
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self._memory = OrderedDict()
+
+    @staticmethod
+    def key(text):
+        # Версия разборщика входит в ключ: после изменения грамматики старые записи просто не найдутся
+        return hashlib.sha256(f"{PARSER_VERSION}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def parse(self, text):
+        key = self.key(text)
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return pickle.loads(data)[2]
+        data = self._load(key)
+        if data is None:
+            result = ConfigParser().parse(text)
+            data = pickle.dumps((CACHE_VERSION, PARSER_VERSION, result), pickle.HIGHEST_PROTOCOL)
+            self._save(key, data)
+        else:
+            result = pickle.loads(data)[2]
+        self._remember(key, data)
+        return result
+
+    def parse_file(self, path):
+        with open(path, "r", encoding="utf-8") as file:
+            return self.parse(file.read())
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as file:
+                data = file.read()
+            version, parser_version, _ = pickle.loads(data)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return None
+        if version != CACHE_VERSION or parser_version != PARSER_VERSION:
+            return None
+        return data
+
+    def _save(self, key, data):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Пишем во временный файл, чтобы прерванный запуск не оставил битый кэш
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as file:
+            file.write(data)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def invalidate(self, text=None):
+        """Удаляет запись для текста, а без аргумента - все записи в памяти и на диске."""
+        if text is not None:
+            keys = [self.key(text)]
+        else:
+            keys = list(self._memory)
+            if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+                keys += [name[:-len(".pickle")] for name in os.listdir(self.cache_dir) if name.endswith(".pickle")]
+        for key in keys:
+            self._memory.pop(key, None)
+            if self.cache_dir is not None:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
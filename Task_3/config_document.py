@@ -0,0 +1,266 @@
+"""Документ для редактора и режима наблюдения: повторный разбор только изменённых записей.
+
+Текст делится на записи верхнего уровня (константа или dict(...)), каждая запись хранит
+значение со ссылками |имя| в виде Ref. Ссылки подставляются лениво при чтении result,
+поэтому константа может быть объявлена и ниже по файлу.
+"""
+from bisect import bisect_right
+
+from dz3 import ConfigParser, ConfigSyntaxError, TreeBuilder
+
+_UNRESOLVED = object()
+
+
+class Ref:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return type(other) is Ref and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f"Ref({self.name!r})"
+
+
+def _references(value, names):
+    if type(value) is Ref:
+        names.add(value.name)
+    elif type(value) is dict:
+        for item in value.values():
+            _references(item, names)
+    elif type(value) is list:
+        for item in value:
+            _references(item, names)
+    return names
+
+
+def _copy(value):
+    if type(value) is dict:
+        return {key: _copy(item) for key, item in value.items()}
+    if type(value) is list:
+        return [_copy(item) for item in value]
+    return value
+
+
+class Entry:
+    """Запись верхнего уровня: name - имя константы или None для dict(...).
+
+    Записи делят текст без пропусков: запись занимает место от своего start до start следующей,
+    комментарии и пробелы после значения относятся к ней.
+    """
+    __slots__ = ("start", "name", "value", "refs", "resolved")
+
+    def __init__(self, start, name, value):
+        self.start = start
+        self.name = name
+        self.value = value
+        self.refs = _references(value, set())
+        self.resolved = _UNRESOLVED
+
+
+class _EntryParser(ConfigParser):
+    def _reference(self, name):
+        self._handler.value(Ref(name))
+
+    def entries(self, text, base=0):
+        self._start(text, None)
+        entries = []
+        try:
+            while self._kind != "end":
+                start = base + self._offset
+                if self._kind == "dict":
+                    self._advance()
+                    self._handler = builder = TreeBuilder()
+                    builder.start_dict()
+                    self._parse_entries()
+                    builder.end_dict()
+                    entries.append(Entry(start, None, builder.result))
+                elif self._kind == "name":
+                    name = self._value
+                    self._parse_constant()
+                    entries.append(Entry(start, name, self.constants[name]))
+                else:
+                    raise self._error("Ожидалось объявление константы или dict(")
+        except RecursionError:
+            raise self._scanner.error(self._offset, "Слишком глубокая вложенность") from None
+        return entries
+
+
+def _common_prefix(a, b):
+    # Сравнение срезов идёт в C, двоичный поиск по длине вместо посимвольного цикла
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _open_end(region):
+    # Комментарий в последней строке участка или имя/число вплотную к его концу в полном тексте
+    # продолжились бы в следующую запись
+    return "#" in region[region.rfind("\n") + 1:] or region[-1:].isalnum() or region.endswith("_")
+
+
+class ConfigDocument:
+    """Разобранный текст с правкой по месту: edit(start, end, text) или update(новый текст).
+
+    Ссылка берёт ближайшее объявление константы выше по тексту, а если его нет - первое ниже;
+    неизвестное имя и циклическая ссылка остаются текстом "|имя|", как в ConfigParser.
+    При синтаксической ошибке правка не применяется и документ остаётся прежним.
+    """
+
+    def __init__(self, text=""):
+        self.text = ""
+        self.entries = []
+        self._definitions = {}
+        # Имя константы -> записи, значения которых на неё ссылаются
+        self._dependents = {}
+        self._cycles = 0
+        self._replace(0, 0, _EntryParser().entries(text), text)
+
+    def update(self, text):
+        """Принимает новый текст целиком и разбирает заново только отличающийся участок."""
+        prefix = _common_prefix(self.text, text)
+        suffix = _common_suffix(self.text, text, min(len(self.text), len(text)) - prefix)
+        if prefix == len(self.text) == len(text):
+            return
+        self.edit(prefix, len(self.text) - suffix, text[prefix:len(text) - suffix])
+
+    def edit(self, start, end, text):
+        """Заменяет self.text[start:end] на text."""
+        new_text = self.text[:start] + text + self.text[end:]
+        if not self.entries:
+            self._replace(0, 0, _EntryParser().entries(new_text), new_text)
+            return
+        starts = [entry.start for entry in self.entries]
+        first = max(bisect_right(starts, start) - 1, 0)
+        # Правка на стыке может склеить запись с хвостом предыдущей (например, убрать перевод строки
+        # после комментария), поэтому соседняя слева запись разбирается вместе с ней
+        if first and start == starts[first]:
+            first -= 1
+        last = max(bisect_right(starts, end) - 1, 0) + 1
+        region_start = 0 if first == 0 else starts[first]
+        region_end = (starts[last] if last < len(starts) else len(self.text)) + len(text) - (end - start)
+        region = new_text[region_start:region_end]
+        try:
+            if region_end < len(new_text) and _open_end(region):
+                raise ConfigSyntaxError("Участок сливается со следующей записью")
+            entries = _EntryParser().entries(region, region_start)
+        except ConfigSyntaxError:
+            # Участок не разбирается сам по себе (например, открыта скобка, закрытая ниже) -
+            # разбираем весь текст, он же даст верную позицию ошибки
+            self._replace(0, len(self.entries), _EntryParser().entries(new_text), new_text)
+            return
+        self._replace(first, last, entries, new_text)
+
+    def _replace(self, first, last, entries, text):
+        removed = self.entries[first:last]
+        shift = len(text) - len(self.text)
+        for entry in self.entries[last:]:
+            entry.start += shift
+        self.entries[first:last] = entries
+        self.text = text
+        if self.entries:
+            self.entries[0].start = 0
+
+        old_values, new_values = {}, {}
+        for entry in removed:
+            for name in entry.refs:
+                self._dependents[name].discard(entry)
+            if entry.name is not None:
+                self._definitions[entry.name].remove(entry)
+                old_values.setdefault(entry.name, []).append(entry.value)
+        for entry in entries:
+            for name in entry.refs:
+                self._dependents.setdefault(name, set()).add(entry)
+            if entry.name is not None:
+                definitions = self._definitions.setdefault(entry.name, [])
+                definitions.insert(bisect_right([item.start for item in definitions], entry.start), entry)
+                new_values.setdefault(entry.name, []).append(entry.value)
+        # Константа, объявленная заново с тем же значением, зависимых не затрагивает
+        self._invalidate(name for name in old_values.keys() | new_values.keys()
+                         if old_values.get(name) != new_values.get(name))
+
+    def _invalidate(self, names):
+        pending = list(names)
+        seen = set(pending)
+        while pending:
+            for entry in self._dependents.get(pending.pop(), ()):
+                entry.resolved = _UNRESOLVED
+                if entry.name is not None and entry.name not in seen:
+                    seen.add(entry.name)
+                    pending.append(entry.name)
+
+    def _definition(self, name, position):
+        definitions = self._definitions.get(name)
+        if not definitions:
+            return None
+        index = bisect_right([entry.start for entry in definitions], position - 1)
+        return definitions[index - 1] if index else definitions[0]
+
+    def _resolve(self, entry, active):
+        if entry.resolved is not _UNRESOLVED:
+            return entry.resolved
+        if not entry.refs:
+            entry.resolved = entry.value
+            return entry.value
+        cycles = self._cycles
+        active.add(entry)
+        try:
+            value = self._substitute(entry.value, entry, active)
+        finally:
+            active.discard(entry)
+        # Значение внутри цикла зависит от того, с какой записи начали, такое не кэшируем
+        if cycles == self._cycles:
+            entry.resolved = value
+        return value
+
+    def _substitute(self, value, entry, active):
+        if type(value) is Ref:
+            definition = self._definition(value.name, entry.start)
+            if definition is None:
+                return f"|{value.name}|"
+            if definition in active:
+                self._cycles += 1
+                return f"|{value.name}|"
+            # Каждая подстановка получает свою копию, как при потоковом разборе
+            return _copy(self._resolve(definition, active))
+        if type(value) is dict:
+            return {key: self._substitute(item, entry, active) for key, item in value.items()}
+        if type(value) is list:
+            return [self._substitute(item, entry, active) for item in value]
+        return value
+
+    @property
+    def constants(self):
+        """Значения констант; при повторном объявлении - последнее."""
+        return {name: self._resolve(definitions[-1], set())
+                for name, definitions in self._definitions.items() if definitions}
+
+    @property
+    def result(self):
+        """Документ как у ConfigParser.parse. Части кэшируются между правками, изменять их нельзя."""
+        result = {}
+        for entry in self.entries:
+            if entry.name is None:
+                result.update(self._resolve(entry, set()))
+        return result
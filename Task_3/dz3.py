@@ -1,118 +1,566 @@
+import argparse
+import contextlib
+import glob
+import io
+import itertools
 import json
+import os
 import re
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+# Один проход по тексту: каждое совпадение начинается там, где кончилось предыдущее,
+# пробелы перед токеном входят в то же совпадение
+TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<comment>\#[^\n]*)
+  | (?P<dict>dict\()
+  | (?P<string>\[\[(?P<text>.*?)\]\])
+  | (?P<ref>\|(?P<ref_name>[^|\n]*)\|)
+  | (?P<number>[0-9]+)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<punct>[=,(){}.])
+)""", re.S | re.X)
+SPACE_RE = re.compile(r"\s*")
+CHUNK_SIZE = 1 << 20
+# Меняется вместе с грамматикой или форматом результата разбора, сбрасывает кэш config_cache
+PARSER_VERSION = 2
+
+
+class ConfigSyntaxError(SyntaxError):
+    # Позиция уже есть в тексте сообщения, стандартный хвост "(line N)" не нужен
+    def __str__(self):
+        return self.msg
+
+
+class Scanner:
+    """Токены (вид, значение, смещение) из строки или файла, читаемого кусками.
+
+    В памяти держится только текущий кусок; номер строки для сообщений об ошибках
+    считается по уже отброшенному тексту.
+    """
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        if isinstance(source, str):
+            self._chunks = iter((source,))
+        else:
+            self._chunks = iter(lambda: source.read(chunk_size), "")
+        self.buffer = ""
+        self.base = 0
+        self.line = 1
+        self.line_start = 0
+        self.eof = False
+
+    def _refill(self, position):
+        # Отбрасываем разобранное начало буфера и дочитываем следующий кусок
+        consumed = self.buffer[:position]
+        newlines = consumed.count("\n")
+        if newlines:
+            self.line += newlines
+            self.line_start = self.base + consumed.rfind("\n") + 1
+        self.base += position
+        chunk = next(self._chunks, "")
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[position:] + chunk
+
+    def locate(self, offset):
+        """Строка и столбец (с единицы) для смещения из ещё не отброшенной части текста."""
+        position = offset - self.base
+        newlines = self.buffer.count("\n", 0, position)
+        if not newlines:
+            return self.line, offset - self.line_start + 1
+        return self.line + newlines, position - self.buffer.rfind("\n", 0, position)
+
+    def char(self, offset):
+        return self.buffer[offset - self.base]
+
+    def error(self, offset, message):
+        line, column = self.locate(offset)
+        error = ConfigSyntaxError(f"{message}: строка {line}, столбец {column}")
+        error.lineno, error.offset = line, column
+        return error
+
+    def __iter__(self):
+        match = TOKEN_RE.match
+        position = 0
+        while True:
+            found = match(self.buffer, position)
+            # Токен у края буфера может продолжаться в следующем куске
+            if found is None or found.end() == len(self.buffer):
+                if not self.eof:
+                    self._refill(position)
+                    position = 0
+                    continue
+                if found is None:
+                    break
+            position = found.end()
+            kind = found.lastgroup
+            if kind == "punct":
+                yield found.group(kind), None, self.base + found.start(kind)
+            elif kind == "name":
+                yield kind, found.group(kind), self.base + found.start(kind)
+            elif kind == "number":
+                yield kind, int(found.group(kind)), self.base + found.start(kind)
+            elif kind == "string":
+                yield kind, found.group("text"), self.base + found.start(kind)
+            elif kind == "ref":
+                yield kind, found.group("ref_name"), self.base + found.start(kind)
+            elif kind == "dict":
+                yield kind, None, self.base + found.start(kind)
+        position = SPACE_RE.match(self.buffer, position).end()
+        if position != len(self.buffer):
+            raise self.error(self.base + position, f"Недопустимый символ {self.buffer[position]!r}")
+        yield "end", None, self.base + position
+
+
+def tokenize(text):
+    """Токены (вид, значение, смещение); пробелы и комментарии пропускаются."""
+    return iter(Scanner(text))
+
+
+class Handler:
+    """Получатель событий разбора в духе SAX; по умолчанию события игнорируются.
+
+    Весь документ - один словарь: start_dict, затем пары key/значение из всех dict(...)
+    верхнего уровня по порядку, затем end_dict. Значение - value для числа или строки либо
+    вложенные start_dict ... end_dict / start_array ... end_array.
+    """
+
+    def start_dict(self):
+        pass
+
+    def key(self, name):
+        pass
+
+    def value(self, value):
+        pass
+
+    def end_dict(self):
+        pass
+
+    def start_array(self):
+        pass
+
+    def end_array(self):
+        pass
+
+
+class TreeBuilder(Handler):
+    """Собирает из событий обычные dict и list."""
+
+    def __init__(self):
+        self.result = None
+        self._stack = []
+        self._key = None
+
+    def _add(self, value):
+        if not self._stack:
+            self.result = value
+        elif type(self._stack[-1]) is dict:
+            self._stack[-1][self._key] = value
+        else:
+            self._stack[-1].append(value)
+
+    def start_dict(self):
+        container = {}
+        self._add(container)
+        self._stack.append(container)
+
+    def start_array(self):
+        container = []
+        self._add(container)
+        self._stack.append(container)
+
+    def key(self, name):
+        self._key = name
+
+    def value(self, value):
+        self._add(value)
+
+    def end_dict(self):
+        self._stack.pop()
+
+    end_array = end_dict
+
+
+class JsonWriter(Handler):
+    """Пишет JSON по мере поступления событий; в памяти только стек вложенности и буфер вывода.
+
+    При indent=4 и уникальных ключах вывод совпадает с json.dumps(..., indent=4). Повторный
+    ключ записывается повторно - json.loads, как и dict.update, оставит последнее значение.
+    """
+
+    def __init__(self, stream, indent=4, ensure_ascii=False, buffer_size=1 << 16):
+        self.stream = stream
+        self.indent = indent
+        self.buffer_size = buffer_size
+        self._encode = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self._parts = []
+        self._size = 0
+        # Число уже записанных элементов в каждом открытом контейнере
+        self._counts = []
+        self._after_key = False
+        # Разделители перед первым и следующими элементами на каждой глубине
+        self._separators = []
+
+    def _write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.stream.write("".join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def _separator(self):
+        depth = len(self._counts)
+        while len(self._separators) <= depth:
+            level = len(self._separators)
+            if self.indent is None:
+                self._separators.append(("", ", ", ""))
+            else:
+                pad = " " * (self.indent * level)
+                self._separators.append(("\n" + pad, ",\n" + pad, "\n" + pad))
+        count = self._counts[-1]
+        self._counts[-1] = count + 1
+        return self._separators[depth][1 if count else 0]
+
+    def _item(self):
+        if self._after_key:
+            self._after_key = False
+            return ""
+        if self._counts:
+            return self._separator()
+        return ""
+
+    def _close(self, bracket):
+        count = self._counts.pop()
+        if count:
+            self._write(self._separators[len(self._counts)][2] + bracket)
+        else:
+            self._write(bracket)
+        if not self._counts:
+            self.flush()
+
+    def start_dict(self):
+        prefix = self._item()
+        self._counts.append(0)
+        self._write(prefix + "{")
+
+    def start_array(self):
+        prefix = self._item()
+        self._counts.append(0)
+        self._write(prefix + "[")
+
+    def key(self, name):
+        self._write(self._separator() + self._encode(name) + ": ")
+        self._after_key = True
+
+    def value(self, value):
+        if type(value) is str:
+            text = self._encode(value)
+        elif type(value) is int:
+            text = int.__repr__(value)
+        else:
+            text = json.dumps(value)
+        self._write(self._item() + text)
+
+    def end_dict(self):
+        self._close("}")
+
+    def end_array(self):
+        self._close("]")
+
+
+def emit(handler, value):
+    """События для уже готового значения (например, константы, подставленной по ссылке)."""
+    if type(value) is dict:
+        handler.start_dict()
+        for name, item in value.items():
+            handler.key(name)
+            emit(handler, item)
+        handler.end_dict()
+    elif type(value) is list:
+        handler.start_array()
+        for item in value:
+            emit(handler, item)
+        handler.end_array()
+    else:
+        handler.value(value)
 
 
 class ConfigParser:
     def __init__(self):
         self.constants = {}
+        # Имена из ссылок, которые feed не смог подставить
+        self.unresolved = set()
 
     def parse(self, text):
-        lines = iter(text.splitlines())
-        parsed = {}
-        for line in lines:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            if "=" in line and not line.startswith("dict("):
-                name, value = map(str.strip, line.split("=", 1))
-                self.constants[name] = self._parse_value(value)
-                continue
-            if line.startswith("dict("):
-                dict_lines = [line]
-                open_brackets = 1
-                while open_brackets > 0:
-                    line = next(lines, "").strip()
-                    if line.startswith("dict("):
-                        open_brackets += 1
-                    elif line.endswith(")"):
-                        open_brackets -= 1
-                    dict_lines.append(line)
-                _, value = self._parse_dict(dict_lines)
-                parsed.update(value)
+        """Разбирает текст целиком. Ссылка может идти раньше объявления константы: значения
+        подставляются после разбора, через config_document.ConfigDocument."""
+        # config_document сам импортирует этот модуль
+        from config_document import ConfigDocument
+
+        document = ConfigDocument(text)
+        self.constants = document.constants
+        return document.result
+
+    def feed(self, source, handler):
+        """Разбирает строку или файл, передавая события в handler по мере чтения.
+
+        Значение подставляется в момент ссылки, поэтому ссылка на константу, объявленную ниже,
+        остаётся текстом "|имя|" - в отличие от parse. Такие имена возвращает forward_references(),
+        по нему write_json переписывает результат через parse.
+        """
+        self._start(source, handler)
+        handler.start_dict()
+        try:
+            while self._kind != "end":
+                if self._kind == "dict":
+                    self._advance()
+                    self._parse_entries()
+                elif self._kind == "name":
+                    self._parse_constant()
+                else:
+                    raise self._error("Ожидалось объявление константы или dict(")
+        except RecursionError:
+            raise self._scanner.error(self._offset, "Слишком глубокая вложенность") from None
+        handler.end_dict()
+
+    def forward_references(self):
+        """Имена констант, на которые ссылались до их объявления."""
+        return self.unresolved & self.constants.keys()
+
+    def _start(self, source, handler):
+        self._scanner = Scanner(source)
+        self._next_token = iter(self._scanner).__next__
+        self._handler = handler
+        self._advance()
+
+    def _advance(self):
+        self._kind, self._value, self._offset = self._next_token()
+
+    def _error(self, message):
+        found = "конец файла" if self._kind == "end" else repr(self._scanner.char(self._offset))
+        return self._scanner.error(self._offset, f"{message}, найдено {found}")
+
+    def _expect(self, kind, message):
+        if self._kind != kind:
+            raise self._error(message)
+        self._advance()
+
+    def _parse_constant(self):
+        # Значение константы нужно целиком для подстановки, поэтому собирается отдельно от потока
+        name = self._value
+        self._advance()
+        self._expect("=", "Ожидалось '=' после имени константы")
+        handler, builder = self._handler, TreeBuilder()
+        self._handler = builder
+        try:
+            self._parse_value()
+        finally:
+            self._handler = handler
+        self.constants[name] = builder.result
+
+    def _reference(self, name):
+        # Ссылка на ещё не объявленную константу остаётся текстом: при потоковом разборе
+        # значение нужно сразу, а объявление может оказаться дальше по файлу
+        value = self.constants.get(name)
+        if value is None:
+            self.unresolved.add(name)
+            value = f"|{name}|"
+        emit(self._handler, value)
+
+    def _parse_value(self):
+        kind, value = self._kind, self._value
+        if kind == "dict":
+            self._advance()
+            self._handler.start_dict()
+            self._parse_entries()
+            self._handler.end_dict()
+        elif kind == "{":
+            self._parse_array()
+        elif kind == "ref":
+            self._advance()
+            self._reference(value)
+        elif kind in ("number", "string", "name"):
+            self._advance()
+            self._handler.value(value)
+        else:
+            raise self._error("Ожидалось значение")
+
+    def _parse_entries(self):
+        # имя = значение, ... ) - пустые записи и запятая в конце допускаются
+        handler = self._handler
+        while True:
+            if self._kind == ")":
+                self._advance()
+                return
+            if self._kind == ",":
+                self._advance()
                 continue
+            if self._kind != "name":
+                raise self._error("Ожидалось имя ключа словаря")
+            handler.key(self._value)
+            self._advance()
+            self._expect("=", "Ожидалось '=' после ключа словаря")
+            self._parse_value()
+            if self._kind not in (",", ")"):
+                raise self._error("Ожидалась ',' или ')' после значения")
 
-            # Обработка массива
-            if line.startswith("{"):
-                value = self._parse_array([line])
-                parsed.update(value)
+    def _parse_array(self):
+        # { значение. значение. ... } - пустые элементы пропускаются
+        self._advance()
+        self._handler.start_array()
+        while True:
+            if self._kind == "}":
+                self._advance()
+                self._handler.end_array()
+                return
+            if self._kind == ".":
+                self._advance()
                 continue
+            self._parse_value()
+            if self._kind not in (".", "}"):
+                raise self._error("Ожидалась '.' или '}' после элемента массива")
 
-            raise SyntaxError(f"Некорректный синтаксис: {line}")
 
-        return parsed
+def expand_inputs(patterns):
+    """Пути по списку файлов и шаблонов glob; шаблон без совпадений возвращается как есть.
 
-    def _parse_dict(self, dict_lines):
-        dict_content = "".join(dict_lines).strip()[5:-1].strip()
-        entries = self._split_dict_entries(dict_content)
-        result = {}
-        for entry in entries:
-            entry = entry.strip()
-            if not entry:
-                continue
-            if "=" not in entry:
-                raise SyntaxError(f"Некорректная запись в словаре: {entry}")
-            key, value = map(str.strip, entry.split("=", 1))
-            if not re.match(r"[a-zA-Z]+", key):
-                raise SyntaxError(f"Некорректное имя ключа словаря: {key}")
-            result[key] = self._parse_value(value)
-        return None, result
-
-    def _split_dict_entries(self, dict_content):
-        entries = []
-        depth = 0
-        current_entry = []
-        for char in dict_content:
-            if char == "(":
-                depth += 1
-            elif char == ")":
-                depth -= 1
-
-            if char == "," and depth == 0:
-                entries.append("".join(current_entry).strip())
-                current_entry = []
-            else:
-                current_entry.append(char)
-        if current_entry:
-            entries.append("".join(current_entry).strip())
-        return entries
-
-    def _parse_value(self, value):
-        value = value.strip()
-        if value.startswith("|") and value.endswith("|"):
-            return self.constants.get(value[1:-1], value)
-        if value.isdigit():
-            return int(value)
-        if value.startswith("[[") and value.endswith("]]"):
-            return value[2:-2]
-        if value.startswith("dict(") and value.endswith(")"):
-            _, dict_value = self._parse_dict([value])
-            return dict_value
-        if value.startswith("{") and value.endswith("}"):
-            return self._parse_array([value])
-        return value
-
-    def _parse_array(self, array_lines):
-        array_content = "".join(array_lines).strip()[1:-1].strip()
-        elements = array_content.split(".")
-        return [self._parse_value(el.strip()) for el in elements if el.strip()]
-
-
-def main():
-    input_file = 'test_correct.conf'
+    Файл, попавший под несколько шаблонов, остаётся один раз - на месте первого появления.
+    """
+    paths = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else []
+        for path in matches or [pattern]:
+            paths.setdefault(os.path.abspath(path), path)
+    return list(paths.values())
+
+
+def output_path(path, output_dir):
+    # Относительный путь повторяется внутри output_dir, чтобы одноимённые файлы из разных каталогов не совпали
+    relative = os.path.relpath(path)
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(path)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + ".json")
+
+
+def write_json(file, out, indent=4):
+    """Пишет JSON файла конфигурации в out по мере разбора.
+
+    Если встретилась ссылка вперёд, написанное стирается и документ разбирается целиком через
+    ConfigParser.parse, так что результат не зависит от способа вызова. out должен поддерживать seek.
+    """
+    start = out.tell()
+    parser = ConfigParser()
+    parser.feed(file, JsonWriter(out, indent=indent))
+    if parser.forward_references():
+        file.seek(0)
+        out.seek(start)
+        out.truncate()
+        emit(JsonWriter(out, indent=indent), ConfigParser().parse(file.read()))
+
+
+def convert_file(path, output_dir=None, indent=4):
+    """Преобразует один файл: (путь, строка NDJSON или None, текст ошибки или None).
+
+    С output_dir результат пишется в файл, иначе возвращается строкой NDJSON. Ошибки
+    не выбрасываются, чтобы один плохой файл не останавливал пакет.
+    """
     try:
-        with open(input_file, "r", encoding="utf-8") as file:
-            config_text = file.read()
+        with open(path, "r", encoding="utf-8") as file:
+            if output_dir is None:
+                out = io.StringIO()
+                out.write('{"path": ' + encode_basestring(path) + ', "data": ')
+                write_json(file, out, indent=None)
+                out.write("}")
+                return path, out.getvalue(), None
+            target = output_path(path, output_dir)
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            # Пишем во временный файл, чтобы ошибка в конце входа не оставила обрезанный JSON
+            with open(f"{target}.tmp", "w", encoding="utf-8") as out:
+                write_json(file, out, indent)
+                out.write("\n")
+            os.replace(f"{target}.tmp", target)
+            return path, None, None
+    except (SyntaxError, ValueError, OSError) as e:
+        if output_dir is not None:
+            with contextlib.suppress(OSError):
+                os.remove(f"{output_path(path, output_dir)}.tmp")
+        return path, None, _error_message(e)
 
-        parser = ConfigParser()
-        parsed_data = parser.parse(config_text)
-        print(json.dumps(parsed_data, ensure_ascii=False, indent=4))
 
-    except FileNotFoundError:
-        print(f"Ошибка: файл '{input_file}' не найден.")
-        sys.exit(1)
-    except SyntaxError as e:
-        print(f"Ошибка синтаксиса: {e}")
+def _error_message(error):
+    if isinstance(error, SyntaxError):
+        return f"Ошибка синтаксиса: {error}"
+    if isinstance(error, UnicodeDecodeError):
+        return "Ошибка кодировки: файл не в UTF-8"
+    if isinstance(error, OSError):
+        return f"Ошибка чтения: {error.strerror or error}"
+    return f"Ошибка: {error}"
+
+
+def convert_batch(paths, output_dir=None, jobs=None, indent=4):
+    """Результаты convert_file для всех путей в исходном порядке, по пулу из jobs процессов."""
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    if jobs <= 1:
+        for path in paths:
+            yield convert_file(path, output_dir, indent)
+        return
+    # Файлы раздаются пачками: на тысячах мелких конфигов пересылка по одному дороже самого разбора
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(jobs) as pool:
+        yield from pool.map(convert_file, paths, itertools.repeat(output_dir), itertools.repeat(indent),
+                            chunksize=chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Преобразование учебного конфигурационного языка в JSON")
+    parser.add_argument("inputs", nargs="*", default=["test_correct.conf"],
+                        help="файлы или шаблоны glob (** - с подкаталогами)")
+    parser.add_argument("-o", "--output-dir", help="писать <каталог>/<путь входа>.json для каждого файла")
+    parser.add_argument("--ndjson", action="store_true",
+                        help='строка {"path": ..., "data": ...} в stdout на каждый файл')
+    parser.add_argument("-j", "--jobs", type=int, help="число процессов, по умолчанию по числу ядер")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if len(paths) == 1 and not args.output_dir and not args.ndjson:
+        input_file = paths[0]
+        try:
+            # JSON копится во временном файле, а не в памяти: при ссылке вперёд он переписывается,
+            # а при ошибке в stdout не попадает обрезанный вывод
+            with open(input_file, "r", encoding="utf-8") as file, \
+                    tempfile.TemporaryFile("w+", encoding="utf-8") as out:
+                write_json(file, out)
+                out.seek(0)
+                shutil.copyfileobj(out, sys.stdout)
+            print()
+
+        except FileNotFoundError:
+            print(f"Ошибка: файл '{input_file}' не найден.")
+            sys.exit(1)
+        except (SyntaxError, ValueError, OSError) as e:
+            print(_error_message(e))
+            sys.exit(1)
+        return
+
+    failed = 0
+    for path, line, error in convert_batch(paths, args.output_dir, args.jobs):
+        if error is not None:
+            failed += 1
+            print(f"{path}: {error}", file=sys.stderr)
+        elif line is not None:
+            sys.stdout.write(line + "\n")
+    if failed:
+        print(f"Ошибок: {failed} из {len(paths)}", file=sys.stderr)
         sys.exit(1)
 
 
@@ -1,6 +1,13 @@
 import unittest
 import os
-from dz3 import ConfigParser
+import io
+import json
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+from config_cache import ConfigCache
+from config_document import ConfigDocument
+from dz3 import PARSER_VERSION, ConfigParser, Handler, JsonWriter, Scanner, TreeBuilder, convert_batch, expand_inputs, main, output_path, tokenize
 
 
 class TestConfigParser(unittest.TestCase):
@@ -64,6 +71,240 @@ dict(
         with self.assertRaises(SyntaxError):
             parser.parse(config_text)
 
+    def test_closing_and_opening_on_one_line(self):
+        parser = ConfigParser()
+        parsed_data = parser.parse("""# комментарий
+items = {1. 2. [[три]]}
+dict(a = dict(b = 1), c = dict(
+    d = |items|), e = word
+)
+""")
+        self.assertEqual(parsed_data, {"a": {"b": 1}, "c": {"d": [1, 2, "три"]}, "e": "word"})
+
+    def test_error_position(self):
+        parser = ConfigParser()
+        with open(self.error_file, "r", encoding="utf-8") as f:
+            config_text = f.read()
+
+        with self.assertRaises(SyntaxError) as context:
+            parser.parse(config_text)
+        self.assertEqual((context.exception.lineno, context.exception.offset), (4, 5))
+        self.assertIn("строка 4, столбец 5", str(context.exception))
+
+    def test_unexpected_character(self):
+        with self.assertRaises(SyntaxError) as context:
+            ConfigParser().parse("dict(\n    key = 1 ^\n)")
+        self.assertEqual((context.exception.lineno, context.exception.offset), (2, 13))
+
+    def test_events(self):
+        events = []
+
+        class Recorder(Handler):
+            def __getattribute__(self, name):
+                if name in ("start_dict", "key", "value", "end_dict", "start_array", "end_array"):
+                    return lambda *args: events.append((name, *args))
+                return super().__getattribute__(name)
+
+        ConfigParser().feed("c = {1. 2}\ndict(a = |c|)\ndict(b = dict(x = [[y]]))", Recorder())
+        self.assertEqual(events, [
+            ("start_dict",), ("key", "a"), ("start_array",), ("value", 1), ("value", 2), ("end_array",),
+            ("key", "b"), ("start_dict",), ("key", "x"), ("value", "y"), ("end_dict",), ("end_dict",)])
+
+    def test_json_writer_matches_json_dumps(self):
+        with open(self.correct_file, "r", encoding="utf-8") as f:
+            config_text = f.read() + "\ndict(empty = dict(), items = {}, list = {1. [[два]]. dict(k = 3)})"
+        expected = ConfigParser().parse(config_text)
+        for indent in (4, None):
+            out = io.StringIO()
+            ConfigParser().feed(io.StringIO(config_text), JsonWriter(out, indent=indent, buffer_size=8))
+            self.assertEqual(out.getvalue(), json.dumps(expected, ensure_ascii=False, indent=indent))
+
+    def test_chunked_scanner(self):
+        with open(self.correct_file, "r", encoding="utf-8") as f:
+            config_text = f.read()
+        for chunk_size in (1, 3, 16):
+            self.assertEqual(list(Scanner(io.StringIO(config_text), chunk_size)), list(tokenize(config_text)))
+        with open(self.error_file, "r", encoding="utf-8") as f:
+            with self.assertRaises(SyntaxError) as context:
+                ConfigParser().feed(f, Handler())
+        self.assertEqual((context.exception.lineno, context.exception.offset), (4, 5))
+
+    def test_batch_ndjson(self):
+        paths = [self.correct_file, self.error_file, "missing.conf", self.correct_file]
+        results = list(convert_batch(paths, jobs=2))
+        self.assertEqual([path for path, _, _ in results], paths)
+        self.assertEqual(json.loads(results[0][1]), {"path": self.correct_file,
+                                                     "data": ConfigParser().parse(self.correct_content)})
+        self.assertIn("строка 4, столбец 5", results[1][2])
+        self.assertIsNotNone(results[2][2])
+        self.assertEqual(results[3], results[0])
+
+    def test_batch_continues_after_bad_encoding(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bad = os.path.join(directory, "cp1251.conf")
+            with open(bad, "w", encoding="cp1251") as f:
+                f.write("dict(ключ = [[значение]])\n")
+            paths = [self.correct_file, bad, self.correct_file]
+            results = list(convert_batch(paths, jobs=2))
+            self.assertEqual(results[1], (bad, None, "Ошибка кодировки: файл не в UTF-8"))
+            self.assertEqual(results[2], results[0])
+            with tempfile.TemporaryDirectory() as output_dir:
+                outputs = list(convert_batch([bad, self.correct_file], output_dir, jobs=1))
+                self.assertEqual([error for _, _, error in outputs], ["Ошибка кодировки: файл не в UTF-8", None])
+                self.assertEqual(sorted(name for _, _, names in os.walk(output_dir) for name in names),
+                                 ["correct_input.json"])
+
+    def test_forward_reference_same_in_every_entry_point(self):
+        text = "dict(x = |later|, y = {|later|. 1})\nlater = dict(v = |base|)\nbase = 5\n"
+        expected = ConfigParser().parse(text)
+        self.assertEqual(expected, {"x": {"v": 5}, "y": [{"v": 5}, 1]})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "forward.conf")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            stdout = io.StringIO()
+            with redirect_stdout(stdout):
+                main([path])
+            self.assertEqual(stdout.getvalue(), json.dumps(expected, indent=4, ensure_ascii=False) + "\n")
+            (_, line, _), = convert_batch([path], jobs=1)
+            self.assertEqual(json.loads(line), {"path": path, "data": expected})
+            output_dir = os.path.join(directory, "out")
+            self.assertEqual(list(convert_batch([path], output_dir, jobs=1)), [(path, None, None)])
+            with open(output_path(path, output_dir), encoding="utf-8") as f:
+                self.assertEqual(json.load(f), expected)
+
+    def test_expand_inputs_deduplicates(self):
+        self.assertEqual(expand_inputs(["*_input.conf", "**/*_input.conf", "./" + self.error_file]),
+                         sorted([self.correct_file, self.error_file]))
+
+    def test_main_output_dir(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with redirect_stdout(stdout), redirect_stderr(stderr), self.assertRaises(SystemExit):
+                main(["-o", output_dir, "-j", "1", "*_input.conf"])
+            self.assertEqual(stdout.getvalue(), "")
+            self.assertIn(self.error_file, stderr.getvalue())
+            self.assertEqual(os.listdir(output_dir), ["correct_input.json"])
+            with open(os.path.join(output_dir, "correct_input.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f), ConfigParser().parse(self.correct_content))
+
+
+class TestConfigCache(unittest.TestCase):
+    text = "c = 1\ndict(a = |c|, b = {[[x]]. 2})"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_memory_hit_returns_copy(self):
+        cache = ConfigCache()
+        first = cache.parse(self.text)
+        first["a"] = "изменено"
+        with mock.patch("config_cache.ConfigParser") as parser:
+            self.assertEqual(cache.parse(self.text), {"a": 1, "b": ["x", 2]})
+        parser.assert_not_called()
+
+    def test_disk_cache_and_invalidate(self):
+        ConfigCache(self.tmp.name).parse(self.text)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1)
+        cache = ConfigCache(self.tmp.name)
+        with mock.patch("config_cache.ConfigParser") as parser:
+            self.assertEqual(cache.parse(self.text), {"a": 1, "b": ["x", 2]})
+        parser.assert_not_called()
+        cache.invalidate(self.text)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+        cache.parse(self.text)
+        cache.parse("dict(k = 1)")
+        cache.invalidate()
+        self.assertEqual(os.listdir(self.tmp.name), [])
+        self.assertEqual(len(cache._memory), 0)
+
+    def test_parser_version_and_broken_file(self):
+        cache = ConfigCache(self.tmp.name, maxsize=0)
+        cache.parse(self.text)
+        with open(os.path.join(self.tmp.name, os.listdir(self.tmp.name)[0]), "wb") as f:
+            f.write(b"broken")
+        self.assertEqual(cache.parse(self.text), {"a": 1, "b": ["x", 2]})
+        key = cache.key(self.text)
+        with mock.patch("config_cache.PARSER_VERSION", PARSER_VERSION + 1):
+            self.assertNotEqual(cache.key(self.text), key)
+
+    def test_lru_eviction(self):
+        cache = ConfigCache(maxsize=2)
+        for value in range(3):
+            cache.parse(f"dict(k = {value})")
+        self.assertEqual(len(cache._memory), 2)
+        self.assertNotIn(cache.key("dict(k = 0)"), cache._memory)
+
+
+class TestConfigDocument(unittest.TestCase):
+    text = """dict(a = |c|, b = |d|)
+c = {1. |d|}
+# комментарий
+dict(e = 5)
+"""
+
+    def test_forward_reference(self):
+        doc = ConfigDocument(self.text)
+        self.assertEqual(doc.result, {"a": [1, "|d|"], "b": "|d|", "e": 5})
+        doc.update(self.text + "d = [[позже]]\n")
+        self.assertEqual(doc.result, {"a": [1, "позже"], "b": "позже", "e": 5})
+
+    def test_parse_resolves_forward_references(self):
+        text = "dict(x = |later|, y = |later|)\nlater = {5}"
+        parser = ConfigParser()
+        result = parser.parse(text)
+        self.assertEqual(result, {"x": [5], "y": [5]})
+        self.assertIsNot(result["x"], result["y"])
+        self.assertEqual(parser.constants, {"later": [5]})
+        # Потоковый разбор подставляет значение в момент ссылки
+        out = io.StringIO()
+        ConfigParser().feed(text, JsonWriter(out, indent=None))
+        self.assertEqual(json.loads(out.getvalue()), {"x": "|later|", "y": "|later|"})
+
+    def test_matches_streaming_without_forward_references(self):
+        def streamed(text):
+            builder = TreeBuilder()
+            ConfigParser().feed(text, builder)
+            return builder.result
+
+        with open("test_correct.conf", encoding="utf-8") as f:
+            config_text = f.read()
+        self.assertEqual(ConfigDocument(config_text).result, streamed(config_text))
+        redefined = "c = 1\ndict(a = |c|)\nc = 2\ndict(b = |c|)\nr = |r|\ndict(r = |r|)"
+        self.assertEqual(ConfigDocument(redefined).result, streamed(redefined))
+
+    def test_edit_reparses_only_affected_entries(self):
+        doc = ConfigDocument(self.text)
+        doc.result
+        entries = list(doc.entries)
+        start = doc.text.index("5")
+        doc.edit(start, start + 1, "6")
+        self.assertEqual(doc.result["e"], 6)
+        self.assertIs(doc.entries[0], entries[0])
+        self.assertIs(doc.entries[1], entries[1])
+        self.assertIsNot(doc.entries[2], entries[2])
+        self.assertEqual(doc.entries[0].resolved, {"a": [1, "|d|"], "b": "|d|"})
+
+        start = doc.text.index("1.")
+        doc.edit(start, start + 1, "7")
+        self.assertEqual(doc.result, {"a": [7, "|d|"], "b": "|d|", "e": 6})
+        self.assertEqual(doc.result, ConfigDocument(doc.text).result)
+
+    def test_edit_spanning_entries_and_error(self):
+        doc = ConfigDocument(self.text)
+        doc.update(self.text.replace("dict(e = 5)", "dict(e = dict(") + "))")
+        self.assertEqual(doc.result["e"], {})
+        text = doc.text
+        with self.assertRaises(SyntaxError) as context:
+            doc.update(text.replace("c = {", "c = dict("))
+        self.assertEqual(context.exception.lineno, 2)
+        self.assertEqual(doc.text, text)
+        # Комментарий без перевода строки поглощает следующую запись
+        doc = ConfigDocument(self.text)
+        doc.update(self.text.replace("# комментарий\n", "# комментарий"))
+        self.assertEqual(doc.result, {"a": [1, "|d|"], "b": "|d|"})
+
 
 if __name__ == "__main__":
     unittest.main()